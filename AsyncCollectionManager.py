@@ -0,0 +1,72 @@
+import asyncio
+from async_database import AsyncDatabaseManager
+from charts import ChartRenderer
+
+
+class AsyncCollectionManager:
+    """
+    An asyncio counterpart of CollectionManager.
+
+    Exposes the same add/edit/remove/search/view/statistics operations as awaitable
+    methods, backed by AsyncDatabaseManager. Charts are only rendered headlessly,
+    on the ChartRenderer worker, and can be awaited through chart_future.
+    """
+
+    def __init__(self, url=None, use_stats_table=False, max_concurrency=None, chart_dir=None, chart_format="png",
+                 owner_id=None):
+        self.db = AsyncDatabaseManager(url, use_stats_table, max_concurrency, owner_id)
+        self.chart_renderer = ChartRenderer(chart_dir, chart_format) if chart_dir else None
+        self.chart_future = None
+
+    async def add_film(self, title, director, genre, status, rating, publication_year, comments="No comments"):
+        return await self.db.add_film(title, director, genre, status, rating, publication_year, comments)
+
+    async def remove_film(self, title):
+        return await self.db.remove_film(title)
+
+    async def edit_film(self, title, new_title=None, new_director=None, new_genre=None, new_status=None,
+                        new_rating=None, new_publication_year=None, new_comments=None):
+        return await self.db.edit_film(title, new_title, new_director, new_genre, new_status, new_rating,
+                                       new_publication_year, new_comments)
+
+    async def edit_status_film(self, title, new_status):
+        return await self.db.edit_film(title, new_status=new_status)
+
+    async def rate_film(self, title, rating):
+        return await self.edit_film(title, new_rating=rating)
+
+    async def comment_film(self, title, comment):
+        return await self.edit_film(title, new_comments=comment)
+
+    async def search_films(self, title=None, genre=None, director=None, rating=None, publication_year=None,
+                           match_all=False):
+        return await self.db.search_films(title, genre, director, rating, publication_year, match_all)
+
+    async def view_collection(self):
+        return await self.db.get_all_films()
+
+    async def view_collection_page(self, sort_by="title", page_size=20, cursor=None, descending=False):
+        return await self.db.get_films_page(sort_by, page_size, cursor, descending)
+
+    async def view_film(self, title):
+        return await self.db.get_film_by_title(title)
+
+    async def view_watched_history(self):
+        return await self.db.get_watched_films()
+
+    async def view_watched_history_page(self, sort_by="title", page_size=20, cursor=None, descending=False):
+        return await self.db.get_films_page(sort_by, page_size, cursor, descending, status="watched")
+
+    async def view_watch_log(self, start=None, end=None, title=None, limit=None):
+        return await self.db.get_watch_events(title, start, end, limit)
+
+    async def generate_statistics(self):
+        stats = await self.db.get_statistics()
+        if stats["total_films"] and self.chart_renderer is not None:
+            self.chart_future = asyncio.wrap_future(self.chart_renderer.submit(self.db.version, stats))
+        return stats
+
+    async def close(self):
+        if self.chart_renderer is not None:
+            self.chart_renderer.shutdown(wait=False)
+        await self.db.dispose()
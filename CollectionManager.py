@@ -1,183 +1,372 @@
+import logging
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
 from database import DatabaseManager
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-from MyException import FilmValueError, ScaleError
+from charts import ChartRenderer, show_statistics
+import os
+import pickle
+from exporter import export_films
+from Film import validate_films
+from importer import ImportReport, chunked, import_files, parse_film_records, validate_chunk
+from sync import sync_file
+from trigram_index import TrigramIndex
+
+logger = logging.getLogger("watchlist.writes")
+
+
+def _text_matches(film, title, director, match_all):
+    checks = [query.lower() in getattr(film, field).lower()
+              for field, query in (("title", title), ("director", director)) if query]
+    return all(checks) if match_all else any(checks)
+
 
 class CollectionManager:
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.watched_history = []
+    def __init__(self, title_index=False, title_index_path=None, chart_dir=None, chart_format="png", owner_id=None,
+                 use_stats_table=False):
+        self.db = DatabaseManager(use_stats_table, owner_id=owner_id)
+        self.chart_renderer = ChartRenderer(chart_dir, chart_format) if chart_dir else None
+        self.chart_future = None
+        self.title_index_path = title_index_path
+        self.title_index = self.load_title_index() if title_index or title_index_path else None
+        self.similarity_index = None
+        self.analytics = None
+        self.index_updates = deque()
+        self.failed_writes = []
+
+    def load_title_index(self):
+        signature = self.db.get_index_signature()
+        if self.title_index_path and os.path.exists(self.title_index_path):
+            try:
+                index = TrigramIndex.load(self.title_index_path)
+            except (OSError, TypeError, EOFError, pickle.UnpicklingError):
+                index = None
+            if index is not None and index.signature == signature:
+                if signature[2] is not None:
+                    for film_id, title, director in self.db.get_title_director_rows(signature[2]):
+                        index.update(film_id, title, director)
+                return index
+        index = TrigramIndex.build(self.db.get_title_director_rows())
+        index.signature = signature
+        return index
+
+    def save_title_index(self):
+        self._apply_index_updates()
+        if self.title_index is not None and self.title_index_path:
+            self.title_index.signature = self.db.get_index_signature()
+            self.title_index.save(self.title_index_path)
+
+    def load_similarity_index(self):
+        from recommender import SimilarityIndex
+
+        return SimilarityIndex.build(self.db.get_similarity_rows())
+
+    def _index_film(self, film):
+        if self.similarity_index is not None:
+            self.similarity_index.set(film.id, film.director, film.genre, film.status, film.rating,
+                                      film.publication_year)
+
+    def _when_written(self, result, update):
+        """
+        Applies update(result) to the in-memory indexes now or, for a write-behind Future,
+        once it has resolved and before the indexes are next read.
+        """
+        if isinstance(result, Future):
+            self.index_updates.append((result, update))
+        else:
+            update(result)
+        return result
+
+    def _apply_index_updates(self):
+        if self.db.write_queue is not None:
+            self.db.write_queue.wait_for_caller()
+        while self.index_updates and self.index_updates[0][0].done():
+            future, update = self.index_updates.popleft()
+            if future.exception() is None:
+                update(future.result())
+            else:
+                self.failed_writes.append(future)
+
+    def wait(self, result):
+        """
+        Returns the result of a change, waiting for it first if write-behind queued it.
+
+        A failed change raises here, and is then no longer reported by flush.
+        """
+        if not isinstance(result, Future):
+            return result
+        error = result.exception()
+        if error is not None:
+            self.index_updates = deque(item for item in self.index_updates if item[0] is not result)
+            self.failed_writes = [future for future in self.failed_writes if future is not result]
+            raise error
+        self._apply_index_updates()
+        return result.result()
+
+    def flush(self):
+        """
+        Waits for every queued write-behind change and logs the errors of failed changes
+        that were not collected with wait.
+        """
+        self.db.flush()
+        self._apply_index_updates()
+        for future in self.failed_writes:
+            logger.error("A write-behind change failed: %s", future.exception())
+        self.failed_writes.clear()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the calls made inside the block into one database transaction.
+
+        If the block raises, the transaction is rolled back and the in-memory indexes,
+        which may already hold its changes, are rebuilt or dropped.
+        """
+        try:
+            with self.db.transaction():
+                yield self
+        except Exception:
+            self.index_updates.clear()
+            if self.title_index is not None:
+                self.title_index = self.load_title_index()
+            self.similarity_index = None
+            raise
 
     def add_film(self, title, director, genre, status, rating, publication_year, comments="No comments"):
-        self.db.add_film(title, director, genre, status, rating, publication_year, comments)
-        if status == "watched":
-            self.watched_history.append((title, datetime.now().strftime("%d-%m-%Y")))
+        def update(film_id):
+            if self.title_index is not None:
+                self.title_index.update(film_id, title, director)
+            if self.similarity_index is not None:
+                self.similarity_index.set(film_id, director, genre, status, rating, publication_year)
+
+        return self._when_written(self.db.add_film(title, director, genre, status, rating, publication_year,
+                                                   comments), update)
+
+    def _index_upserts(self, results, films):
+        self._apply_index_updates()
+        if self.title_index is None and self.similarity_index is None:
+            return
+        for (film_id, outcome), film in zip(results, films):
+            if outcome == "unchanged":
+                continue
+            if self.title_index is not None:
+                self.title_index.update(film_id, film["title"], film["director"])
+            if self.similarity_index is not None:
+                self.similarity_index.set(film_id, film["director"], film["genre"], film["status"], film["rating"],
+                                          film["publication_year"])
+
+    def add_films(self, films, chunk_size=1000):
+        """
+        Validates and upserts many films, one transaction per chunk.
+
+        Parameters
+        ----------
+        films : iterable of dict
+            Film attributes keyed like the arguments of add_film.
+
+        Returns
+        -------
+        ImportReport
+            Inserted, updated and unchanged counts and (position, message) for every rejected film.
+        """
+        report = ImportReport()
+        current_year = datetime.now().year
+        for chunk in chunked(enumerate(films), chunk_size):
+            rows, errors = validate_films(chunk, current_year)
+            report.rejected.extend(errors)
+            report.record(self._write_films(rows))
+        return report
 
     def remove_film(self, title):
-        self.db.remove_film(title)
+        def update(film_id):
+            if self.title_index is not None:
+                self.title_index.remove(film_id)
+            if self.similarity_index is not None:
+                self.similarity_index.remove(film_id)
+
+        return self._when_written(self.db.remove_film(title), update)
 
     def edit_film(self, title, new_title=None, new_director=None, new_genre=None, new_status=None, new_rating=None,
                   new_publication_year=None, new_comments=None):
-        self.db.edit_film(title, new_title, new_director, new_genre, new_status, new_rating, new_publication_year, new_comments)
-        if new_status == "watched":
-            self.watched_history.append((new_title if new_title else title, datetime.now().strftime("%d-%m-%Y")))
-        elif new_status == "unwatched":
-            self.watched_history = [(t, d) for t, d in self.watched_history if t != title]
+        def update(film):
+            if self.title_index is not None and (new_title or new_director):
+                self.title_index.update(film.id, film.title, film.director)
+            self._index_film(film)
+
+        return self._when_written(self.db.edit_film(title, new_title, new_director, new_genre, new_status,
+                                                    new_rating, new_publication_year, new_comments), update)
 
     def edit_status_film(self, title, new_status):
-        self.db.edit_film(title, new_status=new_status)
-        if new_status == "watched":
-            self.watched_history.append((title, datetime.now().strftime("%d-%m-%Y")))
-        elif new_status == "unwatched":
-            self.watched_history = [(t, d) for t, d in self.watched_history if t != title]
+        return self.edit_film(title, new_status=new_status)
 
     def rate_film(self, title, rating):
-        self.edit_film(title, new_rating=rating)
+        return self.edit_film(title, new_rating=rating)
 
     def comment_film(self, title, comment):
-        self.edit_film(title, new_comments=comment)
-
-    def search_films(self, title=None, genre=None, director=None, rating=None, publication_year=None):
-        results = []
-        for film in self.db.get_all_films():
-            if (title and title.lower() in film.title.lower()) or \
-               (genre and genre.lower() in film.genre.lower()) or \
-               (director and director.lower() in film.director.lower()) or \
-               (rating is not None and rating == film.rating) or \
-               (publication_year and publication_year == film.publication_year):
-                results.append(film)
-        return results
+        return self.edit_film(title, new_comments=comment)
+
+    def bulk_edit_films(self, values, titles=None, ids=None, substring=False, **criteria):
+        self._apply_index_updates()
+        affected = None
+        update_titles = self.title_index is not None and ("title" in values or "director" in values)
+        if update_titles or self.similarity_index is not None:
+            affected = self.db.find_film_ids(titles, ids, substring, **criteria)
+        count = self.db.bulk_update_films(values, titles, ids, substring, **criteria)
+        if affected:
+            for film in self.db.get_films_by_ids(affected):
+                if update_titles:
+                    self.title_index.update(film.id, film.title, film.director)
+                self._index_film(film)
+        return count
+
+    def bulk_edit_status(self, new_status, titles=None, ids=None, substring=False, **criteria):
+        return self.bulk_edit_films({"status": new_status}, titles, ids, substring, **criteria)
+
+    def bulk_remove_films(self, titles=None, ids=None, substring=False, **criteria):
+        self._apply_index_updates()
+        affected = ()
+        if self.title_index is not None or self.similarity_index is not None:
+            affected = self.db.find_film_ids(titles, ids, substring, **criteria)
+        count = self.db.bulk_remove_films(titles, ids, substring, **criteria)
+        for film_id in affected:
+            if self.title_index is not None:
+                self.title_index.remove(film_id)
+            if self.similarity_index is not None:
+                self.similarity_index.remove(film_id)
+        return count
+
+    def recommend_similar(self, title, k=10, use_history=True, unwatched_only=False, weights=None):
+        """
+        Returns up to k (film, score) pairs for the films most similar to the given one.
+
+        The similarity index is built on first use and kept up to date by every change
+        made through this manager afterwards.
+        """
+        self._apply_index_updates()
+        film = self.db.get_film_by_title(title)
+        if film is None:
+            raise ValueError(f"Film with title '{title}' not found.")
+        if self.similarity_index is None:
+            self.similarity_index = self.load_similarity_index()
+        matches = self.similarity_index.similar(film.id, k, weights, use_history, unwatched_only)
+        films = {film.id: film for film in self.db.get_films_by_ids(film_id for film_id, _ in matches)}
+        return [(films[film_id], score) for film_id, score in matches if film_id in films]
+
+    def search_films(self, title=None, genre=None, director=None, rating=None, publication_year=None,
+                     match_all=False):
+        self._apply_index_updates()
+        if self.title_index is None or not (title or director):
+            return self.db.search_films(title, genre, director, rating, publication_year, match_all)
+
+        matches = [self.title_index.search(field, query)
+                   for field, query in (("title", title), ("director", director)) if query]
+        ids = set.intersection(*matches) if match_all else set.union(*matches)
+
+        def matching(films):
+            # The index can lag behind writes made by other processes, so every hit is re-checked.
+            return [film for film in films if _text_matches(film, title, director, match_all)]
+
+        if not (genre or rating is not None or publication_year):
+            return matching(self.db.get_films_by_ids(ids))
+        if match_all:
+            if not ids:
+                return []
+            films = self.db.search_films(None, genre, None, rating, publication_year, True)
+            return matching(film for film in films if film.id in ids)
+        films = self.db.search_films(None, genre, None, rating, publication_year)
+        ids.difference_update(film.id for film in films)
+        return sorted(films + matching(self.db.get_films_by_ids(ids)), key=lambda film: film.id)
 
     def view_collection(self):
         films = self.db.get_all_films()
         return films
 
+    def view_collection_page(self, sort_by="title", page_size=20, cursor=None, descending=False):
+        return self.db.get_films_page(sort_by, page_size, cursor, descending)
+
     def view_film(self, title):
         return self.db.get_film_by_title(title)
 
+    def cache_stats(self):
+        return self.db.cache_stats()
+
     def view_watched_history(self):
         return self.db.get_watched_films()
 
+    def view_watch_log(self, start=None, end=None, title=None, limit=None):
+        return self.db.get_watch_events(title, start, end, limit)
+
+    def view_film_history(self, title):
+        return self.db.get_watch_events(title=title)
+
+    def view_watched_history_page(self, sort_by="title", page_size=20, cursor=None, descending=False):
+        return self.db.get_films_page(sort_by, page_size, cursor, descending, status="watched")
+
     def generate_statistics(self):
-        films = self.db.get_all_films()
-        if not films:
-            return {
-                "total_films": 0,
-                "genre_count": {},
-                "average_rating": 0,
-                "watched_count": 0,
-                "unwatched_count": 0,
-                "most_watched_genre": None
-            }
-
-        df = pd.DataFrame([film.__dict__ for film in films])
-
-        genre_count = df['genre'].value_counts().to_dict()
-        average_rating = df['rating'].mean()
-        watched_count = df[df['status'] == 'watched'].shape[0]
-        unwatched_count = df[df['status'] == 'unwatched'].shape[0]
-        most_watched_genre = df[df['status'] == 'watched']['genre'].mode()[0] if watched_count > 0 else None
-
-        stats = {
-            "total_films": len(films),
-            "genre_count": genre_count,
-            "average_rating": average_rating,
-            "watched_count": watched_count,
-            "unwatched_count": unwatched_count,
-            "most_watched_genre": most_watched_genre
-        }
-
-        plt.figure(figsize=(12, 8))
-
-        plt.subplot(2, 2, 1)
-        plt.bar(stats['genre_count'].keys(), stats['genre_count'].values())
-        plt.title('Number of Films by Genre')
-        plt.xlabel('Genre')
-        plt.ylabel('Count')
-
-        plt.subplot(2, 2, 2)
-        plt.bar(['Average Rating'], [stats['average_rating']])
-        plt.title('Average Rating of Films')
-        plt.ylim(0, 10)
-
-        plt.subplot(2, 2, 3)
-        plt.bar(['Watched', 'Unwatched'], [stats['watched_count'], stats['unwatched_count']])
-        plt.title('Watched vs Unwatched Films')
-        plt.xlabel('Status')
-        plt.ylabel('Count')
-
-        plt.subplot(2, 2, 4)
-        if stats['most_watched_genre']:
-            plt.bar([stats['most_watched_genre']], [stats['genre_count'][stats['most_watched_genre']]])
-            plt.title('Most Watched Genre')
-            plt.xlabel('Genre')
-            plt.ylabel('Count')
-        else:
-            plt.bar(['None'], [0])
-            plt.title('Most Watched Genre')
-            plt.xlabel('Genre')
-            plt.ylabel('Count')
+        stats = self.db.get_statistics()
+        if not stats["total_films"]:
+            return stats
 
-        plt.tight_layout()
-        plt.show()
+        if self.chart_renderer is not None:
+            self.chart_future = self.chart_renderer.submit(self.db.version, stats)
+        else:
+            show_statistics(stats)
 
         return stats
 
-    def export_collection_to_file(self, file_path="collection.txt"):
-        films = self.db.get_all_films()
-        with open(file_path, 'w') as file:
-            for film in films:
-                file.write(f"Title: {film.title}\n")
-                file.write(f"Director: {film.director}\n")
-                file.write(f"Genre: {film.genre}\n")
-                file.write(f"Status: {film.status}\n")
-                file.write(f"Rating: {film.rating}\n")
-                file.write(f"Publication Year: {film.publication_year}\n")
-                file.write(f"Comments: {film.comments}\n")
-                file.write("\n")
-
-    def import_collection_from_file(self, file_path="collection.txt"):
+    def export_collection_to_file(self, file_path="collection.txt", fmt=None, compression=None, batch_size=10000):
+        return export_films(self.db.iter_film_rows(batch_size), file_path, fmt, compression, batch_size)
+
+    def collection_analytics(self, snapshot_path=None):
+        """
+        Returns rating, year, decade, genre and director distributions, memoised until the collection changes.
+        """
+        if self.analytics is None or self.analytics.snapshot_path != snapshot_path:
+            from analytics import Analytics
+
+            self.analytics = Analytics(self.db, snapshot_path)
+        return self.analytics.distributions()
+
+    def snapshot_collection(self, path, full=False):
+        from snapshot import write_snapshot
+
+        return write_snapshot(self.db, path, full)
+
+    def _write_films(self, films):
+        results = self.db.upsert_films(films)
+        self._index_upserts(results, films)
+        return results
+
+    def import_collection_from_files(self, source, workers=None, chunk_size=5000, commit_size=50000, progress=None):
+        return import_files(source, self._write_films, workers, chunk_size, commit_size, progress=progress)
+
+    def sync_collection_file(self, file_path="collection.txt", manifest_path=None, prefer="database"):
+        """
+        Applies only the films added, changed or removed since the last sync, from the file
+        to the database and back. See sync.sync_file.
+        """
+        return sync_file(self.db, file_path, self._write_films, lambda ids: self.bulk_remove_films(ids=ids),
+                         manifest_path, prefer)
+
+    def import_collection_from_file(self, file_path="collection.txt", chunk_size=1000):
+        """
+        Imports a collection text file one chunk per transaction. A missing file or a failed
+        write stops the import and is reported in report.error, like import_collection_from_files.
+        """
+        report = ImportReport()
+        current_year = datetime.now().year
         try:
             with open(file_path, 'r') as file:
-                lines = file.readlines()
-                film_data = {}
-                for line in lines:
-                    if line.strip():
-                        key, value = line.strip().split(": ", 1)
-                        film_data[key.lower().replace(" ", "_")] = value
-                    else:
-                        try:
-                            comments = film_data.get("comments", "No comments")
-                            self.add_film(
-                                film_data["title"],
-                                film_data["director"],
-                                film_data["genre"],
-                                film_data["status"],
-                                float(film_data["rating"]),
-                                int(film_data["publication_year"]),
-                                comments
-                            )
-                        except (ValueError, ScaleError, FilmValueError) as e:
-                            print(f"Error importing film: {e}")
-                        film_data = {}
-
-                if film_data:
+                for chunk in chunked(parse_film_records(file), chunk_size):
+                    films = validate_chunk(chunk, report, current_year)
                     try:
-                        comments = film_data.get("comments", "No comments")
-                        self.add_film(
-                            film_data["title"],
-                            film_data["director"],
-                            film_data["genre"],
-                            film_data["status"],
-                            float(film_data["rating"]),
-                            int(film_data["publication_year"]),
-                            comments
-                        )
-                    except (ValueError, ScaleError, FilmValueError) as e:
-                        print(f"Error importing film: {e}")
-
+                        report.record(self._write_films(films))
+                    except Exception as e:
+                        report.error = f"Database write failed: {e}"
+                        break
         except FileNotFoundError:
-            print(f"File {file_path} not found.")
+            report.error = f"File {file_path} not found"
         except Exception as e:
-            print(f"An error occurred while importing collection: {e}")
\ No newline at end of file
+            report.error = str(e)
+        return report
@@ -1,5 +1,104 @@
 from datetime import datetime
 from MyException import ScaleError, FilmValueError
+
+
+def is_name(value):
+    """
+    Checks that value is a non-empty string containing only letters and spaces.
+    """
+    return bool(value) and isinstance(value, str) and value.replace(' ', '').isalpha()
+
+
+def validate_film_values(title, director, genre, status, rating, publication_year, current_year=None):
+    """
+    Validates the attributes of a film.
+
+    Returns
+    -------
+    tuple
+        (title, director, genre, status, rating, publication_year) with the status lowercased.
+
+    Raises
+    ------
+    FilmValueError
+        If title, director, genre or status are invalid, or rating or publication year have the wrong type.
+    ScaleError
+        If rating is not between 0 and 10 or if publication year is not between 1895 and current_year.
+    """
+    if not title or not isinstance(title, str):
+        raise FilmValueError("Title cannot be empty and must be a string")
+    if not is_name(director):
+        raise FilmValueError(
+            "Director cannot be empty and must be a valid string containing only letters and spaces")
+    if not is_name(genre):
+        raise FilmValueError("Genre cannot be empty and must be a valid string containing only letters and spaces")
+    if not status or not isinstance(status, str) or status.lower() not in ("watched", "unwatched"):
+        raise FilmValueError("Status must be either 'watched' or 'unwatched'")
+    if not isinstance(rating, (int, float)):
+        raise FilmValueError("Rating must be a number")
+    if not isinstance(publication_year, int):
+        raise FilmValueError("Publication year must be an integer")
+    if not (0 <= rating <= 10):
+        raise ScaleError("Rating must be between 0 and 10")
+    if current_year is None:
+        current_year = datetime.now().year
+    if not (1895 <= publication_year <= current_year):
+        raise ScaleError(f"Publication year must be between 1895 and {current_year}")
+    return title, director, genre, status.lower(), rating, publication_year
+
+
+def validate_films(records, current_year=None):
+    """
+    Validates a batch of candidate films in one pass.
+
+    Parameters
+    ----------
+    records : iterable of tuple
+        (key, record) pairs, where key identifies the record in error reports (e.g. a line
+        number) and record maps the film attribute names to values. Rating and publication
+        year may be given as strings and are converted.
+    current_year : int, optional
+        The upper bound for publication years. Computed once per batch when omitted.
+
+    Returns
+    -------
+    tuple
+        (rows, errors): rows is a list of dicts ready to be inserted into the films table,
+        errors a list of (key, message) for the rejected records.
+    """
+    if current_year is None:
+        current_year = datetime.now().year
+    rows = []
+    errors = []
+    for key, record in records:
+        try:
+            rating = record["rating"]
+            publication_year = record["publication_year"]
+            if isinstance(rating, str):
+                rating = float(rating)
+            if isinstance(publication_year, str):
+                publication_year = int(publication_year)
+            title, director, genre, status, rating, publication_year = validate_film_values(
+                record["title"], record["director"], record["genre"], record["status"], rating,
+                publication_year, current_year)
+        except KeyError as e:
+            errors.append((key, f"Missing field {e}"))
+            continue
+        except (ValueError, ScaleError, FilmValueError) as e:
+            errors.append((key, str(e)))
+            continue
+        rows.append({
+            "title": title,
+            "director": director,
+            "genre": genre,
+            "status": status,
+            "rating": rating,
+            "publication_year": publication_year,
+            "comments": record.get("comments", "No comments")
+        })
+    return rows, errors
+
+
 class Film:
     """
        A class used to represent a Film.
@@ -21,7 +120,10 @@ class Film:
        comments : str, optional
            Comments about the film.
        """
-    def __init__(self, title, director, genre, status, rating, publication_year, comments="No comments"):
+    __slots__ = ("title", "director", "genre", "status", "rating", "publication_year", "comments")
+
+    def __init__(self, title, director, genre, status, rating, publication_year, comments="No comments",
+                 current_year=None):
         """
         Initializes the Film with title, director, genre, status, rating, and publication year.
 
@@ -39,6 +141,10 @@ class Film:
             The rating of the film. Must be a number between 0 and 10.
         publication_year : int
             The year the film was published. Must be an integer between 1895 and the current year.
+        comments : str, optional
+            Comments about the film.
+        current_year : int, optional
+            The upper bound for publication_year. Defaults to the current year.
 
         Raises
         ------
@@ -47,36 +153,9 @@ class Film:
         ScaleError
             If rating is not between 0 and 10 or if publication year is not between 1895 and the current year.
         """
-        if not title or not isinstance(title, str):
-            raise FilmValueError("Title cannot be empty and must be a string")
-        if not director or not isinstance(director, str) or not director.replace(' ', '').isalpha():
-            raise FilmValueError(
-                "Director cannot be empty and must be a valid string containing only letters and spaces")
-        if not genre or not isinstance(genre, str) or not genre.replace(' ', '').isalpha():
-            raise FilmValueError("Genre cannot be empty and must be a valid string containing only letters and spaces")
-        if not status or status.lower() not in ["watched", "unwatched"]:
-            raise FilmValueError("Status must be either 'watched' or 'unwatched'")
-        if not isinstance(rating, (int, float)):
-            raise FilmValueError("Rating must be a number")
-        if not isinstance(publication_year, int):
-            raise FilmValueError("Publication year must be an integer")
-
-        self.title = title
-        self.genre = genre
-        self.director = director
-        self.status = status.lower()
-
-        if not (0 <= rating <= 10):
-            raise ScaleError("Rating must be between 0 and 10")
-        self.rating = rating
-
-        current_year = datetime.now().year
-        if not (1895 <= publication_year <= current_year):
-            raise ScaleError(f"Publication year must be between 1895 and {current_year}")
-        self.publication_year = publication_year
-
-        self.comments = "No comments"
-
+        (self.title, self.director, self.genre, self.status, self.rating,
+         self.publication_year) = validate_film_values(title, director, genre, status, rating, publication_year,
+                                                       current_year)
         self.comments = comments
 
     def __str__(self):
@@ -1,4 +1,9 @@
+from datetime import datetime, timedelta
+import glob
+import os
+import config
 from CollectionManager import CollectionManager
+from Film import is_name
 from MyException import MovieNotFoundError, ScaleError, FilmValueError
 
 class Main:
@@ -11,13 +16,25 @@ class Main:
         An instance of CollectionManager to manage the film collection.
     options : dict
         A dictionary mapping user input options to corresponding methods.
+    page_size : int
+        Number of films shown per page when browsing.
+    metrics : Metrics or None
+        Operation timings and SQL counters, when instrumentation is enabled.
     """
 
     def __init__(self):
         """
         Initializes the Main class with a CollectionManager instance and menu options.
         """
-        self.manager = CollectionManager()
+        self.manager = CollectionManager(chart_dir=config.CHART_DIR)
+        self.page_size = 20
+        self.metrics = None
+        if config.INSTRUMENT:
+            from instrumentation import Metrics
+            self.metrics = Metrics(config.SLOW_QUERY_MS / 1000, config.SLOW_QUERY_LOG)
+            self.metrics.enable()
+            self.metrics.instrument(self.manager.db)
+            self.metrics.instrument(self.manager)
         self.options = {
             "1": self.add_film,
             "2": self.edit_film,
@@ -32,6 +49,11 @@ class Main:
             "11": self.view_film,
             "12": self.edit_status_film,
             "13": self.import_collection,
+            "14": self.view_watch_log,
+            "15": self.show_metrics,
+            "16": self.recommend_similar,
+            "17": self.show_analytics,
+            "18": self.sync_collection,
             "0": self.exit
         }
 
@@ -54,6 +76,11 @@ class Main:
         11. View a film
         12. Edit a film's status
         13. Import collection from file
+        14. View watch log
+        15. Show performance metrics
+        16. Recommend similar films
+        17. Show rating and year distributions
+        18. Sync collection file
         0. Exit
         """)
 
@@ -90,15 +117,15 @@ class Main:
         """
         title = input("Enter title: ")
         director = input("Enter director: ")
-        if not director.replace(' ', '').isalpha():
+        if not is_name(director):
             raise FilmValueError("Director must be a valid string containing only letters and spaces")
         genre = input("Enter genre: ")
-        if not genre.replace(' ', '').isalpha():
+        if not is_name(genre):
             raise FilmValueError("Genre must be a valid string containing only letters and spaces")
         status = input("Enter status (watched/unwatched): ")
         rating = float(input("Enter rating (0-10): "))
         publication_year = int(input("Enter publication year: "))
-        self.manager.add_film(title, director, genre, status, rating, publication_year)
+        self.manager.wait(self.manager.add_film(title, director, genre, status, rating, publication_year))
 
     def edit_film(self):
         """
@@ -107,16 +134,16 @@ class Main:
         title = input("Enter the title of the film to edit: ")
         new_title = input("Enter new title (leave blank to keep current): ")
         new_director = input("Enter new director (leave blank to keep current): ")
-        if new_director and not new_director.replace(' ', '').isalpha():
+        if new_director and not is_name(new_director):
             raise FilmValueError("Director must be a valid string containing only letters and spaces")
         new_genre = input("Enter new genre (leave blank to keep current): ")
-        if new_genre and not new_genre.replace(' ', '').isalpha():
+        if new_genre and not is_name(new_genre):
             raise FilmValueError("Genre must be a valid string containing only letters and spaces")
         new_status = input("Enter new status (watched/unwatched, leave blank to keep current): ")
         new_rating = input("Enter new rating (0-10, leave blank to keep current): ")
         new_publication_year = input("Enter new publication year (leave blank to keep current): ")
 
-        self.manager.edit_film(
+        self.manager.wait(self.manager.edit_film(
             title,
             new_title if new_title else None,
             new_director if new_director else None,
@@ -124,7 +151,7 @@ class Main:
             new_status if new_status else None,
             float(new_rating) if new_rating else None,
             int(new_publication_year) if new_publication_year else None
-        )
+        ))
 
     def rate_film(self):
         """
@@ -132,7 +159,7 @@ class Main:
         """
         title = input("Enter the title of the film to rate: ")
         rating = float(input("Enter rating (0-10): "))
-        self.manager.rate_film(title, rating)
+        self.manager.wait(self.manager.rate_film(title, rating))
 
     def edit_status_film(self):
         """
@@ -140,7 +167,7 @@ class Main:
         """
         title = input("Enter the title of the film to edit status: ")
         status = input("Enter new status (watched/unwatched): ")
-        self.manager.edit_status_film(title, status)
+        self.manager.wait(self.manager.edit_status_film(title, status))
 
     def comment_film(self):
         """
@@ -148,7 +175,7 @@ class Main:
         """
         title = input("Enter the title of the film to comment on: ")
         comment = input("Enter your comment: ")
-        self.manager.comment_film(title, comment)
+        self.manager.wait(self.manager.comment_film(title, comment))
 
     def search_films(self):
         """
@@ -159,13 +186,15 @@ class Main:
         director = input("Enter director to search (leave blank to skip): ")
         rating = input("Enter rating to search (leave blank to skip): ")
         publication_year = input("Enter publication year to search (leave blank to skip): ")
+        match_all = input("Match all criteria? (y/n, leave blank for any): ").strip().lower() == "y"
 
         results = self.manager.search_films(
             title if title else None,
             genre if genre else None,
             director if director else None,
             float(rating) if rating else None,
-            int(publication_year) if publication_year else None
+            int(publication_year) if publication_year else None,
+            match_all
         )
 
         if not results:
@@ -176,41 +205,113 @@ class Main:
 
     def view_collection(self):
         """
-        Displays the titles of all films in the collection.
+        Displays the collection one page at a time.
+        """
+        self.browse(self.manager.view_collection_page, lambda film: print(
+            f"Title: {film.title}, Director: {film.director}, Genre: {film.genre}, Status: {film.status}, Rating: {film.rating}, Publication Year: {film.publication_year}, Comments: {film.comments}"))
+
+    def browse(self, fetch_page, show_film):
         """
-        films = self.manager.view_collection()
-        for film in films:
-            print(f"Title: {film.title}, Director: {film.director}, Genre: {film.genre}, Status: {film.status}, Rating: {film.rating}, Publication Year: {film.publication_year}, Comments: {film.comments}")
+        Pages through films with next/previous navigation.
+
+        Parameters
+        ----------
+        fetch_page : callable
+            Called with (sort_by, page_size, cursor) and returning a Page.
+        show_film : callable
+            Prints a single film.
+        """
+        sort_by = input("Sort by (title/rating/year/genre, leave blank for title): ") or "title"
+        cursor = None
+        while True:
+            page = fetch_page(sort_by, self.page_size, cursor)
+            if not page.films:
+                print("No films found.")
+                return
+            for film in page:
+                show_film(film)
+            choice = input("n - next page, p - previous page, leave blank to return: ").strip().lower()
+            if choice == "n" and page.next_cursor:
+                cursor = page.next_cursor
+            elif choice == "p" and page.previous_cursor:
+                cursor = page.previous_cursor
+            elif choice in ("n", "p"):
+                print("No more pages in that direction.")
+            else:
+                return
+
     def export_collection(self):
         """
         Prompts the user to specify a file path to export the collection.
+
+        The format and compression follow the file extension, e.g. films.csv, films.jsonl.gz
+        or films.parquet; anything else is written in the collection text format.
         """
         file_path = input("Enter file path to export collection: ")
         if file_path == '':
             file_path = 'collection.txt'
-        self.manager.export_collection_to_file(file_path)
-        print(f"Collection exported to {file_path}")
+        count = self.manager.export_collection_to_file(file_path)
+        print(f"{count} films exported to {file_path}")
 
     def import_collection(self):
         """
-        Prompts the user to import a collection from a file.
+        Prompts the user to import a collection from a file, a directory or a glob pattern.
+
+        Directories and patterns such as drops/*.txt are parsed in parallel by import_collection_from_files.
         """
-        file_path = input("Enter file path to import collection: ")
+        file_path = input("Enter file path, directory or glob pattern to import collection: ")
         if file_path == '':
             file_path = 'collection.txt'
         try:
-            self.manager.import_collection_from_file(file_path)
-            print(f"Collection imported from {file_path}")
+            if os.path.isdir(file_path) or glob.has_magic(file_path):
+                reports = self.manager.import_collection_from_files(file_path, progress=lambda done, total, rows: print(
+                    f"  {done}/{total} files parsed, {rows} films imported"))
+            else:
+                reports = {file_path: self.manager.import_collection_from_file(file_path)}
+            for path, report in reports.items():
+                outcome = "Error importing collection from" if report.error else "Collection imported from"
+                print(f"{outcome} {path}: {report}")
+                for line_number, message in report.rejected:
+                    print(f"  line {line_number}: {message}")
         except Exception as e:
             print(f"Error importing collection: {e}")
 
+    def sync_collection(self):
+        """
+        Prompts the user for a collection file and syncs it with the database in both directions.
+
+        Only the films added, changed or removed on either side since the last sync are applied.
+        """
+        file_path = input("Enter file path to sync: ")
+        if file_path == '':
+            file_path = 'collection.txt'
+        prefer = input("Which side wins conflicts (database/file, leave blank for database): ").strip().lower()
+        report = self.manager.sync_collection_file(file_path, prefer=prefer or "database")
+        print(f"Collection synced with {file_path}: {report}")
+        for line_number, message in report.rejected:
+            print(f"  line {line_number}: {message}")
+
     def view_watched_history(self):
         """
-        Displays the history of watched films.
+        Displays the watched films one page at a time.
         """
-        watched_films = self.manager.view_watched_history()
-        for film in watched_films:
-            print(f"Title: {film.title}, Director: {film.director}, Genre: {film.genre}, Rating: {film.rating}, Publication Year: {film.publication_year}, Comments: {film.comments}")
+        self.browse(self.manager.view_watched_history_page, lambda film: print(
+            f"Title: {film.title}, Director: {film.director}, Genre: {film.genre}, Rating: {film.rating}, Publication Year: {film.publication_year}, Comments: {film.comments}"))
+
+    def view_watch_log(self):
+        """
+        Displays when films were marked watched or unwatched, newest first.
+        """
+        title = input("Enter title to show its history (leave blank for all films): ")
+        start = input("Enter start date dd-mm-YYYY (leave blank to skip): ")
+        end = input("Enter end date dd-mm-YYYY (leave blank to skip): ")
+        start = datetime.strptime(start, "%d-%m-%Y") if start else None
+        end = datetime.strptime(end, "%d-%m-%Y") + timedelta(days=1) if end else None
+        events = self.manager.view_watch_log(start, end, title if title else None)
+        if not events:
+            print("No watch events found.")
+        for film_title, status, timestamp in events:
+            print(f"{timestamp.strftime('%d-%m-%Y %H:%M')}  {film_title}: {status}")
 
     def generate_statistics(self):
         """
@@ -223,6 +324,9 @@ class Main:
         print("Watched Count:", stats["watched_count"])
         print("Unwatched Count:", stats["unwatched_count"])
         print("Most Watched Genre:", stats["most_watched_genre"])
+        if self.manager.chart_future is not None:
+            self.manager.chart_future.add_done_callback(
+                lambda future: print(f"Charts saved to {future.result()}") if not future.exception() else None)
 
     def remove_film(self):
         """
@@ -230,7 +334,7 @@ class Main:
         """
         title = input("Enter the title of the film to remove: ")
         try:
-            self.manager.remove_film(title)
+            self.manager.wait(self.manager.remove_film(title))
             print(f"Film '{title}' removed from the collection.")
         except MovieNotFoundError as e:
             print(e)
@@ -249,12 +353,58 @@ class Main:
         except MovieNotFoundError as e:
             print(e)
 
+    def recommend_similar(self):
+        """
+        Prompts the user for a film and lists the films most similar to it.
+        """
+        title = input("Enter the title of the film: ")
+        count = input("How many recommendations (leave blank for 10): ")
+        unwatched_only = input("Only unwatched films? (y/n): ").strip().lower() == "y"
+        recommendations = self.manager.recommend_similar(title, int(count) if count else 10,
+                                                         unwatched_only=unwatched_only)
+        if not recommendations:
+            print("No recommendations.")
+        for film, score in recommendations:
+            print(f"{score:5.2f}  {film}")
+
+    def show_analytics(self):
+        """
+        Prints the rating histogram, films per decade and the directors with the most films.
+        """
+        analytics = self.manager.collection_analytics()
+        print(f"Films: {analytics['films']}, watched: {analytics['watched_ratio']:.0%}")
+        histogram = analytics["rating_histogram"]
+        print("Ratings:")
+        for low, high, count in zip(histogram["edges"], histogram["edges"][1:], histogram["counts"]):
+            print(f"  {low:g}-{high:g}: {count}")
+        print("Films per decade:")
+        for decade, count in analytics["decade_counts"].items():
+            print(f"  {decade}s: {count}")
+        print("Directors with the most films:")
+        directors = sorted(analytics["directors"].items(), key=lambda item: (-item[1]["films"], item[0]))
+        for director, summary in directors[:10]:
+            print(f"  {director}: {summary['films']} films, average rating {summary['average_rating']:.2f}, "
+                  f"{summary['watched_ratio']:.0%} watched")
+
+    def show_metrics(self):
+        """
+        Prints the collected performance metrics as text or JSON.
+        """
+        if self.metrics is None:
+            print("Instrumentation is disabled. Set WATCHLIST_INSTRUMENT=1 to enable it.")
+            return
+        fmt = input("Output format (text/json, leave blank for text): ").strip().lower()
+        print(self.metrics.to_json() if fmt == "json" else self.metrics.to_text())
+
     def exit(self):
         """
         Exits the program.
         """
+        self.manager.flush()
+        self.manager.save_title_index()
         print("Exit from the program.")
         exit()
 
 
-Main().run()
+if __name__ == "__main__":
+    Main().run()
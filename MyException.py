@@ -8,4 +8,8 @@ class MovieNotFoundError(Exception):
 
 class FilmValueError(Exception):
     """Raised if the movie wasn't made properly."""
-    pass
\ No newline at end of file
+    pass
+
+class CommandError(Exception):
+    """Raised when a batch script command is malformed or incomplete."""
+    pass
@@ -0,0 +1,120 @@
+"""
+Vectorised distributions over the film collection.
+
+The columns come either from one narrow query (genre, director, status, rating and
+year, with genre and director dictionary-encoded) or from a columnar snapshot written
+by snapshot.py. Every distribution is then a bincount, a searchsorted binning or a
+grouped reduction over NumPy arrays, and the results are memoised until the
+collection changes.
+"""
+import os
+import threading
+import numpy as np
+from snapshot import DICTIONARY_COLUMNS, MANIFEST, open_snapshot, rows_to_columns
+
+RATING_EDGES = tuple(range(11))
+
+
+def rating_histogram(ratings, edges=RATING_EDGES):
+    """
+    Counts ratings per bin; bins are closed on the left, except the last which also holds its right edge.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    bins = np.searchsorted(edges, ratings, side="right") - 1
+    np.clip(bins, 0, len(edges) - 2, out=bins)
+    return {"edges": edges.tolist(), "counts": np.bincount(bins, minlength=len(edges) - 1).tolist()}
+
+
+def value_counts(values):
+    """Returns {value: count} for the non-zero counts of small non-negative integers."""
+    if not len(values):
+        return {}
+    low = int(values.min())
+    counts = np.bincount(values.astype(np.int64) - low)
+    present = np.flatnonzero(counts)
+    return dict(zip((present + low).tolist(), counts[present].tolist()))
+
+
+def grouped(codes, dictionary, ratings, watched):
+    """
+    Returns {value: {'films', 'average_rating', 'watched_ratio'}} for a dictionary-encoded column.
+    """
+    size = len(dictionary)
+    films = np.bincount(codes, minlength=size)
+    rating_sums = np.bincount(codes, weights=ratings, minlength=size)
+    watched_counts = np.bincount(codes, weights=watched, minlength=size)
+    present = np.flatnonzero(films)
+    averages = rating_sums[present] / films[present]
+    ratios = watched_counts[present] / films[present]
+    return {dictionary[code]: {"films": int(count), "average_rating": round(float(average), 4),
+                               "watched_ratio": round(float(ratio), 4)}
+            for code, count, average, ratio in zip(present, films[present], averages, ratios)}
+
+
+def distributions(columns, dictionaries, rating_edges=RATING_EDGES):
+    """
+    Computes every distribution from snapshot-style columns and dictionaries.
+    """
+    ratings = np.asarray(columns["rating"], dtype=np.float64)
+    years = np.asarray(columns["publication_year"])
+    statuses = dictionaries["status"]
+    if "watched" in statuses:
+        watched = (np.asarray(columns["status"]) == statuses.index("watched")).astype(np.float64)
+    else:
+        watched = np.zeros(len(ratings))
+    return {
+        "films": int(len(ratings)),
+        "watched_ratio": round(float(watched.mean()), 4) if len(ratings) else 0.0,
+        "rating_histogram": rating_histogram(ratings, rating_edges),
+        "year_counts": value_counts(years),
+        "decade_counts": {decade * 10: count for decade, count in value_counts(years // 10).items()},
+        "genres": grouped(columns["genre"], dictionaries["genre"], ratings, watched),
+        "directors": grouped(columns["director"], dictionaries["director"], ratings, watched)
+    }
+
+
+class Analytics:
+    """
+    Memoised collection distributions.
+
+    Results are recomputed only when the DatabaseManager's version changes or, when
+    reading a snapshot, when its manifest is rewritten. The version only counts
+    changes made through that manager, so changes made by other processes show up
+    after the next local write or a snapshot refresh.
+
+    Attributes
+    ----------
+    snapshot_path : str or None
+        Snapshot directory to read instead of querying the database.
+    """
+
+    def __init__(self, db, snapshot_path=None, rating_edges=RATING_EDGES):
+        self.db = db
+        self.snapshot_path = snapshot_path
+        self.rating_edges = rating_edges
+        self.lock = threading.Lock()
+        self._key = None
+        self._result = None
+
+    def _source_key(self):
+        if self.snapshot_path:
+            stat = os.stat(os.path.join(self.snapshot_path, MANIFEST))
+            return "snapshot", stat.st_mtime_ns, stat.st_size
+        return "database", self.db.version
+
+    def _load(self):
+        if self.snapshot_path:
+            snapshot = open_snapshot(self.snapshot_path)
+            return snapshot.columns, snapshot.dictionaries
+        dictionaries = {name: [] for name in DICTIONARY_COLUMNS}
+        columns, _ = rows_to_columns(self.db.iter_snapshot_rows(), dictionaries)
+        return columns, dictionaries
+
+    def distributions(self):
+        with self.lock:
+            key = self._source_key()
+            if key != self._key:
+                columns, dictionaries = self._load()
+                self._result = distributions(columns, dictionaries, self.rating_edges)
+                self._key = key
+            return self._result
@@ -0,0 +1,157 @@
+import asyncio
+from contextlib import asynccontextmanager
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import config
+import queries
+from models import Base, Film, GenreStats, engine_options, is_memory_url
+
+
+class AsyncDatabaseManager:
+    """
+    An asyncio counterpart of DatabaseManager built on SQLAlchemy's AsyncSession.
+
+    Every call runs in its own session. A semaphore bounds how many calls hold a
+    connection at once, so a burst of coroutines queues on the event loop instead of
+    exhausting the pool. An in-memory SQLite database lives in one shared connection,
+    which cannot run two sessions at once, so it always gets a concurrency of 1.
+
+    Attributes
+    ----------
+    url : str
+        Async database URL, e.g. 'sqlite+aiosqlite:///watchlist.db' or 'mssql+aioodbc://...'.
+    use_stats_table : bool
+        Whether writes maintain the genre_stats summary table and statistics are read
+        from it instead of aggregating the films. The table is rebuilt on first use.
+    version : int
+        Counter bumped after every committed change.
+    owner_id : int
+        The user whose collection every call reads and writes.
+    """
+
+    def __init__(self, url=None, use_stats_table=False, max_concurrency=None, owner_id=None):
+        self.url = url or config.ASYNC_DATABASE_URL
+        if not self.url:
+            raise ValueError("An async database URL is required (set WATCHLIST_ASYNC_DATABASE_URL)")
+        self.owner_id = config.OWNER_ID if owner_id is None else owner_id
+        self.use_stats_table = use_stats_table
+        self.version = 0
+        if is_memory_url(self.url):
+            max_concurrency = 1
+        self.semaphore = asyncio.Semaphore(max_concurrency or config.ASYNC_MAX_CONCURRENCY)
+        self._engine = None
+        self._sessionmaker = None
+        self._engine_lock = asyncio.Lock()
+
+    async def get_engine(self):
+        if self._engine is None:
+            async with self._engine_lock:
+                if self._engine is None:
+                    engine = create_async_engine(self.url, **engine_options(self.url))
+                    async with engine.begin() as connection:
+                        await connection.run_sync(Base.metadata.create_all)
+                    self._sessionmaker = async_sessionmaker(engine, class_=AsyncSession, autoflush=False,
+                                                            expire_on_commit=False)
+                    self._engine = engine
+                    if self.use_stats_table:
+                        await self._rebuild_statistics()
+        return self._engine
+
+    @asynccontextmanager
+    async def session_scope(self):
+        await self.get_engine()
+        async with self.semaphore:
+            async with self._sessionmaker() as session:
+                try:
+                    yield session
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+                    raise
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def _run(self, operation, *args):
+        """Runs one of the write operations of the queries module in its own session."""
+        async with self.session_scope() as session:
+            result, changes = await session.run_sync(operation, self.owner_id, self.use_stats_table, *args)
+        if changes is not None:
+            self.version += 1
+        return result
+
+    async def add_film(self, title, director, genre, status, rating, publication_year, comments):
+        return await self._run(queries.add_film, title, director, genre, status, rating, publication_year, comments)
+
+    async def upsert_films(self, films, chunk_size=1000):
+        if not films:
+            return []
+        return await self._run(queries.upsert_films, films, chunk_size)
+
+    async def remove_film(self, title):
+        return await self._run(queries.remove_film, title)
+
+    async def edit_film(self, title, new_title=None, new_director=None, new_genre=None, new_status=None,
+                        new_rating=None, new_publication_year=None, new_comments=None):
+        return await self._run(queries.edit_film, title, new_title, new_director, new_genre, new_status, new_rating,
+                               new_publication_year, new_comments)
+
+    async def search_films(self, title=None, genre=None, director=None, rating=None, publication_year=None,
+                           match_all=False):
+        async with self.session_scope() as session:
+            return await session.run_sync(queries.search_films, self.owner_id, title, genre, director, rating,
+                                          publication_year, match_all)
+
+    async def get_films_page(self, sort_by="title", page_size=20, cursor=None, descending=False, status=None):
+        statement, backward = queries.page_select(self.owner_id, sort_by, page_size, cursor, descending, status)
+        async with self.session_scope() as session:
+            films = (await session.scalars(statement)).all()
+        return queries.page_from_films(list(films), sort_by, page_size, cursor, backward)
+
+    async def get_statistics(self):
+        if self.use_stats_table:
+            statement = queries.genre_stats_select(self.owner_id)
+        else:
+            statement = queries.genre_aggregate_select(self.owner_id)
+        async with self.session_scope() as session:
+            rows = (await session.execute(statement)).all()
+        return queries.statistics_from_rows(rows)
+
+    async def _rebuild_statistics(self):
+        async with self._sessionmaker() as session:
+            await session.execute(delete(GenreStats).where(GenreStats.owner_id == self.owner_id))
+            await session.execute(queries.rebuild_stats_insert(self.owner_id))
+            await session.commit()
+
+    async def rebuild_statistics(self):
+        async with self.session_scope() as session:
+            await session.execute(delete(GenreStats).where(GenreStats.owner_id == self.owner_id))
+            await session.execute(queries.rebuild_stats_insert(self.owner_id))
+        self.version += 1
+
+    async def get_watch_events(self, title=None, start=None, end=None, limit=None):
+        async with self.session_scope() as session:
+            film_id = None
+            if title is not None:
+                film_id = (await session.scalars(select(Film.id).where(Film.owner_id == self.owner_id,
+                                                                       Film.title == title).limit(1))).first()
+                if film_id is None:
+                    raise ValueError(f"Film with title '{title}' not found.")
+            rows = (await session.execute(queries.watch_events_select(self.owner_id, film_id, start, end, limit))).all()
+            return [tuple(row) for row in rows]
+
+    async def get_all_films(self):
+        async with self.session_scope() as session:
+            return (await session.scalars(select(Film).where(Film.owner_id == self.owner_id))).all()
+
+    async def get_film_by_title(self, title):
+        async with self.session_scope() as session:
+            return (await session.scalars(select(Film).where(Film.owner_id == self.owner_id, Film.title == title)
+                                          .limit(1))).first()
+
+    async def get_watched_films(self):
+        async with self.session_scope() as session:
+            return (await session.scalars(select(Film).where(Film.owner_id == self.owner_id,
+                                                             Film.status == 'watched'))).all()
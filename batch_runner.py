@@ -0,0 +1,243 @@
+"""
+Runs a script of collection operations without the interactive menu.
+
+Each line of the script is one command, either a JSON object such as
+    {"op": "add", "title": "Alien", "director": "Ridley Scott", "genre": "horror",
+     "status": "watched", "rating": 8, "publication_year": 1979}
+or a plain-text command of shell-quoted words, where key=value sets an argument and
+bare words fill the arguments in order:
+    rate "Alien" 9
+    search director=scott match_all=yes
+Blank lines and lines starting with # are skipped.
+
+Every command runs through one CollectionManager, so a script of thousands of
+operations pays the process start and database connection once. With --transaction
+the whole script is one transaction that is rolled back at the first failure.
+A JSON result per command is written to stdout, followed by a summary. In a
+transaction the results are held back until it ends; if it is rolled back, the
+commands that had succeeded are reported with "ok": false and "rolled_back": true.
+
+Usage:
+    python batch_runner.py jobs.jsonl
+    python batch_runner.py --transaction - < jobs.txt
+    python batch_runner.py --owner 7 jobs.jsonl
+"""
+import argparse
+import json
+import shlex
+import sys
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from CollectionManager import CollectionManager
+from Film import validate_film_values
+from models import Film
+from MyException import CommandError
+
+OPERATIONS = {
+    "add": ("add_film", ("title", "director", "genre", "status", "rating", "publication_year", "comments")),
+    "edit": ("edit_film", ("title", "new_title", "new_director", "new_genre", "new_status", "new_rating",
+                           "new_publication_year", "new_comments")),
+    "rate": ("rate_film", ("title", "rating")),
+    "comment": ("comment_film", ("title", "comment")),
+    "status": ("edit_status_film", ("title", "new_status")),
+    "remove": ("remove_film", ("title",)),
+    "search": ("search_films", ("title", "genre", "director", "rating", "publication_year", "match_all")),
+    "export": ("export_collection_to_file", ("file_path", "fmt", "compression"))
+}
+CONVERTERS = {
+    "rating": float,
+    "new_rating": float,
+    "publication_year": int,
+    "new_publication_year": int,
+    "match_all": lambda value: value.strip().lower() in ("1", "true", "yes", "on")
+}
+
+
+def parse_command(line):
+    """
+    Parses one script line into (operation, arguments), or returns None for blank and comment lines.
+
+    Raises
+    ------
+    CommandError
+        If the line is malformed, names an unknown operation or passes unknown arguments.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        try:
+            arguments = json.loads(line)
+        except ValueError as e:
+            raise CommandError(f"Invalid JSON: {e}")
+        if not isinstance(arguments, dict):
+            raise CommandError("A JSON command must be an object")
+        operation = arguments.pop("op", None)
+        positional = []
+    else:
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            raise CommandError(f"Invalid command: {e}")
+        operation, words = words[0], words[1:]
+        positional = [word for word in words if "=" not in word]
+        arguments = dict(word.split("=", 1) for word in words if "=" in word)
+    if operation not in OPERATIONS:
+        raise CommandError(f"Unknown operation '{operation}'. Expected one of: {', '.join(OPERATIONS)}")
+    _, names = OPERATIONS[operation]
+    if len(positional) > len(names):
+        raise CommandError(f"Too many arguments for '{operation}'")
+    for name, value in zip(names, positional):
+        arguments.setdefault(name, value)
+    unknown = set(arguments) - set(names)
+    if unknown:
+        raise CommandError(f"Unknown arguments for '{operation}': {', '.join(sorted(unknown))}")
+    try:
+        for name, value in arguments.items():
+            if name in CONVERTERS and isinstance(value, str):
+                arguments[name] = CONVERTERS[name](value)
+    except ValueError as e:
+        raise CommandError(f"Invalid value: {e}")
+    return operation, arguments
+
+
+def _film_dict(film):
+    return {"id": film.id, "title": film.title, "director": film.director, "genre": film.genre,
+            "status": film.status, "rating": film.rating, "publication_year": film.publication_year,
+            "comments": film.comments}
+
+
+def _result_value(value):
+    if isinstance(value, list):
+        return [_film_dict(film) for film in value]
+    if isinstance(value, Film):
+        return _film_dict(value)
+    return value
+
+
+def run_command(manager, operation, arguments):
+    """
+    Runs one parsed command and returns its raw result, possibly a write-behind Future.
+    """
+    method, _ = OPERATIONS[operation]
+    if operation == "add":
+        arguments.setdefault("comments", "No comments")
+        missing = [name for name in OPERATIONS["add"][1] if name not in arguments]
+        if missing:
+            raise CommandError(f"Missing arguments for 'add': {', '.join(missing)}")
+        values = validate_film_values(arguments["title"], arguments["director"], arguments["genre"],
+                                      arguments["status"], arguments["rating"], arguments["publication_year"],
+                                      datetime.now().year)
+        arguments.update(zip(OPERATIONS["add"][1], values))
+    elif "title" not in arguments and operation not in ("search", "export"):
+        raise CommandError(f"'{operation}' needs a title")
+    return getattr(manager, method)(**arguments)
+
+
+def run_script(manager, lines, output=sys.stdout, transaction=False):
+    """
+    Runs every command of a script, writing one JSON result line per command.
+
+    Returns
+    -------
+    dict
+        Summary with the numbers of succeeded and failed commands and, in transaction
+        mode, whether the transaction was committed and how many succeeded commands
+        were rolled back.
+    """
+    summary = {"succeeded": 0, "failed": 0}
+    pending = deque()
+    records = []
+
+    def emit(line_number, operation, result=None, error=None):
+        record = {"line": line_number, "op": operation, "ok": error is None}
+        if error is None:
+            record["result"] = _result_value(result)
+            summary["succeeded"] += 1
+        else:
+            record["error"] = str(error)
+            summary["failed"] += 1
+        if transaction:
+            records.append(record)
+        else:
+            output.write(json.dumps(record) + "\n")
+
+    def drain(block=False):
+        while pending and (block or pending[0][2].done()):
+            line_number, operation, future = pending.popleft()
+            try:
+                result = manager.wait(future)
+            except Exception as e:
+                emit(line_number, operation, error=e)
+            else:
+                emit(line_number, operation, result)
+
+    def execute(stop_on_error):
+        for line_number, line in enumerate(lines, 1):
+            operation = None
+            try:
+                command = parse_command(line)
+                if command is None:
+                    continue
+                operation, arguments = command
+                result = run_command(manager, operation, arguments)
+            except Exception as e:
+                drain(block=True)
+                emit(line_number, operation, error=e)
+                if stop_on_error:
+                    raise
+                continue
+            if isinstance(result, Future):
+                pending.append((line_number, operation, result))
+            else:
+                drain(block=True)
+                emit(line_number, operation, result)
+            drain()
+        drain(block=True)
+        manager.flush()
+
+    if not transaction:
+        execute(False)
+        return summary
+    try:
+        with manager.transaction():
+            execute(True)
+    except Exception as e:
+        summary["committed"] = False
+        summary["rolled_back"] = summary["succeeded"]
+        summary["succeeded"] = 0
+        if not summary["failed"]:
+            summary["error"] = f"Commit failed: {e}"
+        for record in records:
+            if record["ok"]:
+                record.update(ok=False, rolled_back=True)
+    else:
+        summary["committed"] = True
+    for record in records:
+        output.write(json.dumps(record) + "\n")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a script of collection operations.")
+    parser.add_argument("script", help="JSON Lines or plain-text script, or - for standard input")
+    parser.add_argument("--transaction", action="store_true",
+                        help="run the whole script in one transaction, rolled back at the first failure")
+    parser.add_argument("--owner", type=int, help="user whose collection the script works on "
+                                                  "(default: WATCHLIST_OWNER_ID)")
+    args = parser.parse_args(argv)
+
+    manager = CollectionManager(owner_id=args.owner)
+    if args.script == "-":
+        summary = run_script(manager, sys.stdin, transaction=args.transaction)
+    else:
+        with open(args.script) as file:
+            summary = run_script(manager, file, transaction=args.transaction)
+    manager.db.shutdown()
+    print(json.dumps({"summary": summary}))
+    return 1 if summary["failed"] or summary.get("committed") is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
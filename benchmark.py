@@ -0,0 +1,301 @@
+"""
+Reproducible benchmarks for the collection manager.
+
+Every run builds seeded synthetic collections in a throwaway SQLite database, so no
+MSSQL server is needed, and times the common operations on each of them. Each
+scenario is timed over several repetitions with tracemalloc off and reported as the
+median; one more run under tracemalloc records the Python memory high-water mark.
+Results are written as JSON; passing a baseline compares the medians against it and
+exits with status 1 when a scenario regressed.
+
+With --users, one database is shared by a growing number of users and one user's
+operations are timed at every step; with per-user indexes their latency should stay
+flat as the other users' films are added.
+
+Usage:
+    python benchmark.py --sizes 10000 100000 --output results.json
+    python benchmark.py --sizes 10000 --baseline results.json --threshold 0.2 --repeat 7
+    python benchmark.py --sizes 1000 --users 1 10 100 --films-per-user 2000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from statistics import median
+import models
+from CollectionManager import CollectionManager
+
+GENRES = ["drama", "comedy", "horror", "thriller", "animation", "documentary", "romance", "western",
+          "science fiction", "fantasy", "crime", "musical"]
+FIRST_NAMES = ["Ann", "Bob", "Clara", "David", "Eva", "Frank", "Greta", "Hugo", "Ida", "Jan", "Karl", "Lena",
+               "Marta", "Nils", "Olga", "Piotr", "Rosa", "Sven", "Tara", "Umberto"]
+LAST_NAMES = ["Kowalski", "Smith", "Nowak", "Bergman", "Varda", "Kurosawa", "Fellini", "Tarkovsky", "Lynch",
+              "Campion", "Wajda", "Haneke", "Kieslowski", "Ozu", "Herzog", "Agnes"]
+WORDS = ["night", "river", "city", "silent", "red", "last", "winter", "dream", "road", "garden", "stone", "mirror"]
+SEARCHES = {
+    "search_title": {"title": "river"},
+    "search_genre": {"genre": "western"},
+    "search_director": {"director": "tarkovsky"},
+    "search_rating": {"rating": 7.5},
+    "search_year": {"publication_year": 1977}
+}
+
+
+def generate_films(count, seed=0):
+    """
+    Yields count reproducible, valid film records.
+    """
+    rng = random.Random(seed)
+    current_year = datetime.now().year
+    for number in range(count):
+        yield {
+            "title": f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {number:07d}",
+            "director": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "genre": rng.choice(GENRES),
+            "status": "watched" if rng.random() < 0.4 else "unwatched",
+            "rating": round(rng.uniform(0, 10) * 2) / 2,
+            "publication_year": rng.randint(1895, current_year),
+            "comments": "No comments"
+        }
+
+
+def write_collection_file(path, films):
+    with open(path, 'w') as file:
+        for film in films:
+            file.write(f"Title: {film['title']}\n"
+                       f"Director: {film['director']}\n"
+                       f"Genre: {film['genre']}\n"
+                       f"Status: {film['status']}\n"
+                       f"Rating: {film['rating']}\n"
+                       f"Publication Year: {film['publication_year']}\n"
+                       f"Comments: {film['comments']}\n"
+                       "\n")
+
+
+def use_database(path):
+    if os.path.exists(path):
+        os.remove(path)
+    models.configure(f"sqlite:///{path}")
+
+
+def clear_cache(manager):
+    if manager.db.film_cache is not None:
+        manager.db.film_cache.clear()
+
+
+def measure(function, repeat=5, setup=None):
+    """
+    Times function over repeat runs, then measures its peak memory in one more run.
+
+    The timed runs happen with tracemalloc stopped, as tracing every allocation slows
+    the code down unevenly; only the last run is traced.
+
+    Parameters
+    ----------
+    function : callable
+        The scenario.
+    repeat : int
+        Number of timed runs.
+    setup : callable, optional
+        Called untimed before every run to restore the state the scenario starts from.
+
+    Returns
+    -------
+    tuple
+        (median seconds, seconds of every timed run, peak traced memory in KiB).
+    """
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return median(runs), runs, peak / 1024
+
+
+def recorder(results, repeat=5):
+    """
+    Returns a record(name, function, setup=None) callable that measures function into results.
+    """
+    def record(name, function, setup=None):
+        seconds, runs, peak = measure(function, repeat, setup)
+        results[name] = {"seconds": round(seconds, 6), "runs": [round(run, 6) for run in runs],
+                         "peak_kib": round(peak, 1)}
+        print(f"  {name:<16} {seconds:10.4f}s median ({min(runs):.4f}s-{max(runs):.4f}s) {peak / 1024:10.1f} MiB",
+              file=sys.stderr)
+
+    return record
+
+
+def run_size(size, workdir, seed, operations, repeat=5):
+    """
+    Times every scenario on a collection of size films.
+
+    Scenarios that change the collection get a setup that undoes their changes, so
+    every repetition starts from the same state.
+    """
+    results = {}
+    record = recorder(results, repeat)
+    managers = []
+
+    def fresh_database(name):
+        use_database(os.path.join(workdir, name))
+        managers[:] = [CollectionManager()]
+
+    record("seed", lambda: managers[0].add_films(generate_films(size, seed), chunk_size=10000),
+           lambda: fresh_database(f"bench-{size}.db"))
+    manager = managers[0]
+
+    record("view_page", lambda: [manager.view_collection_page(sort_by, 50) for sort_by in ("title", "rating",
+                                                                                          "year", "genre")])
+    titles = [film["title"] for film in generate_films(size, seed)][::max(1, size // operations)]
+    record("view_film", lambda: [manager.view_film(title) for title in titles], lambda: clear_cache(manager))
+    for name, criteria in SEARCHES.items():
+        record(name, lambda criteria=criteria: manager.search_films(**criteria))
+    record("statistics", lambda: manager.db.get_statistics())
+    export_path = os.path.join(workdir, f"export-{size}.txt")
+    record("export", lambda: manager.export_collection_to_file(export_path))
+
+    extra = list(generate_films(operations, seed + 1))
+    for number, film in enumerate(extra):
+        film["title"] = f"Benchmark film {number:07d}"
+    extra_titles = [film["title"] for film in extra]
+    record("add", lambda: [manager.add_film(**film) for film in extra],
+           lambda: manager.bulk_remove_films(titles=extra_titles))
+    record("edit", lambda: [manager.edit_film(film["title"], new_rating=5.0, new_comments="edited")
+                            for film in extra],
+           lambda: manager.bulk_edit_films({"rating": 0.0, "comments": "No comments"}, titles=extra_titles))
+
+    import_path = os.path.join(workdir, f"import-{size}.txt")
+    write_collection_file(import_path, generate_films(size, seed))
+    record("import", lambda: managers[0].import_collection_from_file(import_path, chunk_size=5000),
+           lambda: fresh_database(f"import-{size}.db"))
+    manager = managers[0]
+    record("reimport", lambda: manager.import_collection_from_file(import_path, chunk_size=5000))
+    return results
+
+
+def run_users(user_counts, films_per_user, workdir, seed, operations, repeat=5):
+    """
+    Times user 1's reads as more users, each with films_per_user films, share one database.
+
+    Returns
+    -------
+    dict
+        'users-N' -> scenario measurements, for every N in user_counts.
+    """
+    use_database(os.path.join(workdir, "users.db"))
+    titles = [film["title"] for film in generate_films(films_per_user, seed + 1)]
+    titles = titles[::max(1, films_per_user // operations)]
+    results = {}
+    populated = 0
+    for users in sorted(set(user_counts)):
+        for owner_id in range(populated + 1, users + 1):
+            CollectionManager(owner_id=owner_id).add_films(generate_films(films_per_user, seed + owner_id),
+                                                           chunk_size=10000)
+        populated = users
+        print(f"{users} users of {films_per_user} films:", file=sys.stderr)
+        scenarios = results[f"users-{users}"] = {}
+        record = recorder(scenarios, repeat)
+        manager = CollectionManager(owner_id=1)
+        record("view_page", lambda: [manager.view_collection_page(sort_by, 50)
+                                     for sort_by in ("title", "rating", "year", "genre")])
+        record("view_film", lambda: [manager.view_film(title) for title in titles], lambda: clear_cache(manager))
+        for name, criteria in SEARCHES.items():
+            record(name, lambda criteria=criteria: manager.search_films(**criteria))
+        record("statistics", lambda: manager.db.get_statistics())
+        export_path = os.path.join(workdir, f"export-users-{users}.txt")
+        record("export", lambda: manager.export_collection_to_file(export_path))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Lists scenarios whose median time grew by more than threshold (0.2 = 20%) over the baseline.
+    """
+    regressions = []
+    for size, scenarios in results["results"].items():
+        for name, measurement in scenarios.items():
+            reference = baseline.get("results", {}).get(size, {}).get(name)
+            if not reference or reference["seconds"] <= 0:
+                continue
+            change = measurement["seconds"] / reference["seconds"] - 1
+            if change > threshold:
+                regressions.append((size, name, reference["seconds"], measurement["seconds"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the collection manager on synthetic collections.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000],
+                        help="collection sizes to benchmark, e.g. 10000 100000 1000000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--operations", type=int, default=200, help="single-film adds, edits and lookups per size")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario; the median is reported")
+    parser.add_argument("--users", type=int, nargs="+",
+                        help="also time one user's reads as the database is shared by this many users, e.g. 1 10 100")
+    parser.add_argument("--films-per-user", type=int, default=1000, help="films per user in the --users runs")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results stored by an earlier --output run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, 0.2 = 20%%")
+    parser.add_argument("--workdir", help="directory for the temporary databases and files")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "operations": args.operations,
+            "repeat": args.repeat,
+            "created": datetime.now().isoformat(timespec="seconds")
+        },
+        "results": {}
+    }
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for size in args.sizes:
+            print(f"{size} films:", file=sys.stderr)
+            results["results"][str(size)] = run_size(size, workdir, args.seed, args.operations, args.repeat)
+        if args.users:
+            results["results"].update(run_users(args.users, args.films_per_user, workdir, args.seed,
+                                                args.operations, args.repeat))
+        models.configure()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for size, name, before, after, change in regressions:
+            print(f"REGRESSION {size}/{name}: {before:.4f}s -> {after:.4f}s (+{change:.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
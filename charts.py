@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def draw_statistics(figure, stats):
+    """
+    Draws the four statistics panels onto a matplotlib figure.
+
+    Parameters
+    ----------
+    figure : matplotlib.figure.Figure
+        The figure to draw on.
+    stats : dict
+        The dictionary returned by DatabaseManager.get_statistics.
+    """
+    axes = figure.add_subplot(2, 2, 1)
+    axes.bar(list(stats['genre_count'].keys()), list(stats['genre_count'].values()))
+    axes.set_title('Number of Films by Genre')
+    axes.set_xlabel('Genre')
+    axes.set_ylabel('Count')
+
+    axes = figure.add_subplot(2, 2, 2)
+    axes.bar(['Average Rating'], [stats['average_rating']])
+    axes.set_title('Average Rating of Films')
+    axes.set_ylim(0, 10)
+
+    axes = figure.add_subplot(2, 2, 3)
+    axes.bar(['Watched', 'Unwatched'], [stats['watched_count'], stats['unwatched_count']])
+    axes.set_title('Watched vs Unwatched Films')
+    axes.set_xlabel('Status')
+    axes.set_ylabel('Count')
+
+    axes = figure.add_subplot(2, 2, 4)
+    if stats['most_watched_genre']:
+        axes.bar([stats['most_watched_genre']], [stats['genre_count'][stats['most_watched_genre']]])
+    else:
+        axes.bar(['None'], [0])
+    axes.set_title('Most Watched Genre')
+    axes.set_xlabel('Genre')
+    axes.set_ylabel('Count')
+
+    figure.tight_layout()
+
+
+def show_statistics(stats):
+    """
+    Shows the statistics charts in an interactive window.
+    """
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(12, 8))
+    draw_statistics(figure, stats)
+    plt.show()
+
+
+def render_statistics(stats, path, fmt="png"):
+    """
+    Renders the statistics charts to a file without a display.
+
+    The figure is drawn through the Agg canvas directly, so it never touches pyplot's
+    global state and can run on a worker thread.
+
+    Returns
+    -------
+    str
+        The path of the written file.
+    """
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(12, 8))
+    draw_statistics(figure, stats)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    figure.savefig(temp_path, format=fmt)
+    os.replace(temp_path, path)
+    return path
+
+
+class ChartRenderer:
+    """
+    Renders statistics charts on a background worker and caches the result.
+
+    Renders are cached by collection version, so asking again for an unchanged
+    collection returns the same future. File names carry a digest of the stats,
+    which keeps files written by an earlier process valid after a restart.
+
+    Attributes
+    ----------
+    output_dir : str
+        Directory the chart files are written to.
+    fmt : str
+        Image format, 'png' or 'svg'.
+    """
+
+    def __init__(self, output_dir="charts", fmt="png"):
+        if fmt not in ("png", "svg"):
+            raise ValueError("Chart format must be either 'png' or 'svg'")
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-renderer")
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    def chart_path(self, stats):
+        digest = hashlib.sha1(json.dumps(stats, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return os.path.join(self.output_dir, f"statistics-{digest}.{self.fmt}")
+
+    def submit(self, version, stats):
+        """
+        Schedules rendering of stats for the given collection version.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Resolves to the chart file path.
+        """
+        with self.lock:
+            future = self.cache.get(version)
+            if future is not None and not (future.done() and future.exception()):
+                return future
+            path = self.chart_path(stats)
+            if os.path.exists(path):
+                future = Future()
+                future.set_result(path)
+            else:
+                os.makedirs(self.output_dir, exist_ok=True)
+                future = self.executor.submit(render_statistics, stats, path, self.fmt)
+            self.cache = {version: future}
+            return future
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -1,57 +1,464 @@
-from models import Film, SessionLocal
+import threading
+from contextlib import contextmanager
+import config
+import queries
+from cache import LRUCache
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, select, update
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models import Film, GenreStats, WatchEvent, session_scope
+from write_queue import GroupCommitQueue
+
+
+@contextmanager
+def _joined(session):
+    yield session
+    session.flush()
+    session.expunge_all()
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.session = SessionLocal()
+    """
+    use_stats_table makes every write maintain the genre_stats summary table and
+    get_statistics read it instead of aggregating the films. Writers without it leave
+    the table behind, so it is rebuilt when a manager with it is created.
+    """
+
+    def __init__(self, use_stats_table=False, cache_size=None, cache_ttl=None, write_behind=None, group_size=None,
+                 group_interval=None, owner_id=None):
+        self.owner_id = config.OWNER_ID if owner_id is None else owner_id
+        self.use_stats_table = use_stats_table
+        cache_size = config.FILM_CACHE_SIZE if cache_size is None else cache_size
+        cache_ttl = config.FILM_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.film_cache = LRUCache(cache_size, cache_ttl or None) if cache_size else None
+        self.version = 0
+        self._version_lock = threading.Lock()
+        self.write_queue = None
+        self._local = threading.local()
+        if use_stats_table:
+            self.rebuild_statistics()
+        if config.WRITE_BEHIND if write_behind is None else write_behind:
+            group_size = config.WRITE_GROUP_SIZE if group_size is None else group_size
+            group_interval = config.WRITE_GROUP_MS / 1000 if group_interval is None else group_interval
+            self.write_queue = GroupCommitQueue(session_scope, self._after_write, group_size, group_interval)
+
+    def session_scope(self):
+        if self.write_queue is not None:
+            self.write_queue.wait_for_caller()
+        session = getattr(self._local, "session", None)
+        if session is not None:
+            return _joined(session)
+        return session_scope()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs every call this thread makes on the manager inside the block in one transaction.
+
+        The calls share one session, which is flushed after each call so later calls see
+        earlier changes, and the block commits or rolls back as a whole. Nested blocks
+        join the outer transaction, and write-behind queueing is bypassed inside it.
+        """
+        if getattr(self._local, "session", None) is not None:
+            yield
+            return
+        with self.session_scope() as session:
+            self._local.session = session
+            try:
+                yield
+            except Exception:
+                if self.film_cache is not None:
+                    self.film_cache.clear()
+                self._bump_version()
+                raise
+            finally:
+                self._local.session = None
+
+    def _write(self, operation, *args):
+        """
+        Runs a single-film mutation in its own transaction, or hands it to the write-behind
+        queue and returns a Future when that is enabled.
+        """
+        if self.write_queue is not None and getattr(self._local, "session", None) is None:
+            return self.write_queue.submit(operation, *args)
+        with self.session_scope() as session:
+            result, changes = operation(session, *args)
+        self._after_write(changes)
+        return result
+
+    def _after_write(self, changes):
+        if changes is not None:
+            titles, ids = changes
+            self._invalidate(titles, ids)
+            self._bump_version()
+
+    def flush(self):
+        """Waits until every queued write-behind mutation is committed."""
+        if self.write_queue is not None:
+            self.write_queue.flush()
+
+    def shutdown(self):
+        """Drains the write-behind queue and stops its writer thread."""
+        if self.write_queue is not None:
+            self.write_queue.shutdown()
+
+    def _invalidate(self, titles=(), ids=()):
+        if self.film_cache is not None:
+            self.film_cache.invalidate(*[("title", title) for title in titles], *[("id", film_id) for film_id in ids])
+
+    def _cache_film(self, key, film):
+        if self.film_cache is not None:
+            self.film_cache.set(key, film)
+            if film is not None:
+                self.film_cache.set(("id", film.id), film)
+
+    def cache_stats(self):
+        return self.film_cache.stats() if self.film_cache is not None else None
+
+    def _bump_version(self):
+        with self._version_lock:
+            self.version += 1
 
     def add_film(self, title, director, genre, status, rating, publication_year, comments):
-        new_film = Film(
-            title=title,
-            director=director,
-            genre=genre,
-            status=status,
-            rating=rating,
-            publication_year=publication_year,
-            comments=comments
-        )
-        self.session.add(new_film)
-        self.session.commit()
+        """
+        Adds a film, or updates the film with the same title, director and year.
+
+        Nothing is written when that film already has identical attributes.
+
+        Returns
+        -------
+        int
+            The id of the added or existing film, or a Future for it in write-behind mode.
+        """
+        return self._write(queries.add_film, self.owner_id, self.use_stats_table, title, director, genre, status,
+                           rating, publication_year, comments)
+
+    def upsert_films(self, films, chunk_size=1000):
+        """
+        Inserts new films and updates changed ones in one transaction, matching on the
+        natural key (title, director and year). Films whose stored content hash is
+        unchanged are not written at all.
+
+        Returns
+        -------
+        list of tuple
+            (film_id, outcome) per film, where outcome is 'inserted', 'updated' or 'unchanged'.
+        """
+        if not films:
+            return []
+        with self.session_scope() as session:
+            results, changes = queries.upsert_films(session, self.owner_id, self.use_stats_table, films, chunk_size)
+        self._after_write(changes)
+        return results
 
     def remove_film(self, title):
-        film = self.session.query(Film).filter(Film.title == title).first()
-        if film:
-            self.session.delete(film)
-            self.session.commit()
-        else:
-            raise ValueError(f"Film with title '{title}' not found.")
+        return self._write(queries.remove_film, self.owner_id, self.use_stats_table, title)
 
     def edit_film(self, title, new_title=None, new_director=None, new_genre=None, new_status=None, new_rating=None,
                   new_publication_year=None, new_comments=None):
-        film = self.session.query(Film).filter(Film.title == title).first()
-        if film:
-            if new_title:
-                film.title = new_title
-            if new_director:
-                film.director = new_director
-            if new_genre:
-                film.genre = new_genre
-            if new_status:
-                film.status = new_status
-            if new_rating is not None:
-                film.rating = new_rating
-            if new_publication_year is not None:
-                film.publication_year = new_publication_year
-            if new_comments:
-                film.comments = new_comments
-            self.session.commit()
+        return self._write(queries.edit_film, self.owner_id, self.use_stats_table, title, new_title, new_director,
+                           new_genre, new_status, new_rating, new_publication_year, new_comments)
+
+    def search_films(self, title=None, genre=None, director=None, rating=None, publication_year=None,
+                     match_all=False):
+        with self.session_scope() as session:
+            return queries.search_films(session, self.owner_id, title, genre, director, rating, publication_year,
+                                        match_all)
+
+    def _bulk_selection(self, session, titles, ids, criteria, substring=False, chunk_size=1000):
+        """
+        Returns the where clauses selecting the films of a bulk operation, one per chunk of
+        at most chunk_size titles and ids, which keeps every statement under the 2100
+        parameters SQL Server allows.
+        """
+        clauses = [Film.owner_id == self.owner_id]
+        unknown = set(criteria) - queries.SEARCH_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown search criteria: {', '.join(sorted(unknown))}")
+        if criteria:
+            values = [criteria.get(name) for name in ("title", "genre", "director", "rating", "publication_year")]
+            resolved = queries.resolve_text_values(session, self.owner_id, values[1], values[2], substring)
+            search = queries.search_criteria(*values, True, resolved) if substring \
+                else queries.exact_criteria(*values, resolved)
+            if search is not None:
+                clauses.append(search)
+        if titles is None and ids is None and len(clauses) == 1:
+            raise ValueError("A bulk operation needs titles, ids or search criteria")
+        selections = [clauses]
+        for column, values in ((Film.title, titles), (Film.id, ids)):
+            if values is not None:
+                values = list(values)
+                selections = [selection + [column.in_(values[start:start + chunk_size])]
+                              for selection in selections for start in range(0, len(values), chunk_size)]
+        return [and_(*selection) for selection in selections]
+
+    def _id_selection(self, session, selections, chunk_size=1000):
+        """Replaces the where clauses with ones selecting the ids they match now, in chunks."""
+        ids = [film_id for where in selections for film_id in session.scalars(select(Film.id).where(where))]
+        return [Film.id.in_(ids[start:start + chunk_size]) for start in range(0, len(ids), chunk_size)]
+
+    def find_film_ids(self, titles=None, ids=None, substring=False, **criteria):
+        with self.session_scope() as session:
+            selections = self._bulk_selection(session, titles, ids, criteria, substring)
+            return [film_id for where in selections for film_id in session.scalars(select(Film.id).where(where))]
+
+    def bulk_update_films(self, values, titles=None, ids=None, substring=False, **criteria):
+        """
+        Applies the same changes to every matching film with a single UPDATE per chunk of
+        titles or ids, all in one transaction.
+
+        Films are selected by titles, ids and/or search criteria (title, genre, director,
+        rating, publication_year), all of which must match. Title, genre and director
+        criteria match the whole value regardless of case, or any part of it with
+        substring=True, so genre='drama' does not touch melodramas by accident. A status change also appends
+        a watch event for every film whose status actually changes, with one INSERT ... SELECT.
+        Changing the title, director or year recomputes the natural keys of the matched
+        films; other changes clear their content hashes, so the next import rewrites them.
+
+        Returns
+        -------
+        int
+            The number of updated films.
+        """
+        unknown = set(values) - queries.EDITABLE_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown film fields: {', '.join(sorted(unknown))}")
+        if not values:
+            return 0
+        count = 0
+        with self.session_scope() as session:
+            selections = self._bulk_selection(session, titles, ids, criteria, substring)
+            if queries.KEY_FIELDS & set(values):
+                # A new title could make a later chunk match the films an earlier one updated.
+                selections = self._id_selection(session, selections)
+            for where in selections:
+                if self.use_stats_table:
+                    rows = session.execute(queries.genre_aggregate_select(self.owner_id).where(where)).all()
+                    deltas = queries.bulk_stats_deltas(rows, values, 1)
+                if "status" in values:
+                    session.execute(insert(WatchEvent).from_select(
+                        ["owner_id", "film_id", "status", "ts"],
+                        select(Film.owner_id, Film.id, literal(values["status"]), literal(datetime.now(), DateTime))
+                        .where(where, Film.status != values["status"])
+                    ))
+                count += session.execute(update(Film).where(where).values(**values, content_hash=None)
+                                         .execution_options(synchronize_session=False)).rowcount
+                if queries.KEY_FIELDS & set(values):
+                    for film in session.scalars(select(Film).where(where)).all():
+                        queries.refresh_keys(film)
+                    try:
+                        session.flush()
+                    except IntegrityError:
+                        raise ValueError("The update would give several films the same title, director and year.")
+                if self.use_stats_table:
+                    queries.apply_stats(session, self.owner_id, deltas)
+        if self.film_cache is not None:
+            self.film_cache.clear()
+        self._bump_version()
+        return count
+
+    def bulk_set_status(self, new_status, titles=None, ids=None, substring=False, **criteria):
+        return self.bulk_update_films({"status": new_status}, titles, ids, substring, **criteria)
+
+    def bulk_remove_films(self, titles=None, ids=None, substring=False, **criteria):
+        """
+        Deletes every matching film and its watch events in one transaction. Films are
+        selected like in bulk_update_films.
+
+        Returns
+        -------
+        int
+            The number of removed films.
+        """
+        count = 0
+        with self.session_scope() as session:
+            selections = self._bulk_selection(session, titles, ids, criteria, substring)
+            for where in selections:
+                if self.use_stats_table:
+                    rows = session.execute(queries.genre_aggregate_select(self.owner_id).where(where)).all()
+                    queries.apply_stats(session, self.owner_id, queries.bulk_stats_deltas(rows, {}, -1))
+                session.execute(delete(WatchEvent).where(WatchEvent.film_id.in_(select(Film.id).where(where))))
+                count += session.execute(delete(Film).where(where)
+                                         .execution_options(synchronize_session=False)).rowcount
+        if self.film_cache is not None:
+            self.film_cache.clear()
+        self._bump_version()
+        return count
+
+    def get_films_by_ids(self, ids, chunk_size=1000):
+        ids = list(ids)
+        films = []
+        with self.session_scope() as session:
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                films.extend(session.query(Film).filter(Film.owner_id == self.owner_id, Film.id.in_(chunk)).all())
+        return sorted(films, key=lambda film: film.id)
+
+    def get_title_director_rows(self, since=None):
+        statement = select(Film.id, Film.title, Film.director).where(Film.owner_id == self.owner_id)
+        if since is not None:
+            statement = statement.where(queries.changed_since(since))
+        with self.session_scope() as session:
+            yield from session.execute(statement.execution_options(yield_per=10000))
+
+    def get_similarity_rows(self):
+        with self.session_scope() as session:
+            yield from session.query(Film.id, Film.director, Film.genre, Film.status, Film.rating,
+                                     Film.publication_year).filter(Film.owner_id == self.owner_id).yield_per(10000)
+
+    def get_index_signature(self):
+        """
+        Returns (film count, highest id, latest change time). Adds and removals always
+        change it; an edit committed late with an earlier time may not, so an index saved
+        with it is patched with the films changed in the overlap before that time.
+        """
+        with self.session_scope() as session:
+            count, max_id, changed = session.query(func.count(Film.id), func.max(Film.id), func.max(Film.updated_at)) \
+                .filter(Film.owner_id == self.owner_id).one()
+        return count, max_id, changed
+
+    def get_statistics(self):
+        if self.use_stats_table:
+            statement = queries.genre_stats_select(self.owner_id)
         else:
-            raise ValueError(f"Film with title '{title}' not found.")
+            statement = queries.genre_aggregate_select(self.owner_id)
+        with self.session_scope() as session:
+            rows = session.execute(statement).all()
+        return queries.statistics_from_rows(rows)
+
+    def rebuild_statistics(self):
+        with self.session_scope() as session:
+            session.execute(delete(GenreStats).where(GenreStats.owner_id == self.owner_id))
+            session.execute(queries.rebuild_stats_insert(self.owner_id))
+        self._bump_version()
+
+    def get_films_page(self, sort_by="title", page_size=20, cursor=None, descending=False, status=None):
+        """
+        Returns one page of films using keyset pagination on (sort column, id).
+
+        Each page is a single indexed range scan that seeks past the cursor, so the
+        cost of a page does not depend on how deep into the collection it is.
+        """
+        statement, backward = queries.page_select(self.owner_id, sort_by, page_size, cursor, descending, status)
+        with self.session_scope() as session:
+            films = session.scalars(statement).all()
+        return queries.page_from_films(films, sort_by, page_size, cursor, backward)
+
+    def iter_film_rows(self, batch_size=1000):
+        statement = select(Film.title, Film.director, Film.genre, Film.status, Film.rating,
+                           Film.publication_year, Film.comments).where(Film.owner_id == self.owner_id).order_by(Film.id)
+        with self.session_scope() as session:
+            for partition in session.execute(statement.execution_options(yield_per=batch_size)).partitions():
+                yield from partition
+
+    def iter_snapshot_rows(self, since=None, batch_size=10000):
+        """
+        Yields (id, genre, director, status, rating, publication_year, updated_at) rows,
+        only those changed since when it is given; see queries.changed_since.
+        """
+        statement = select(Film.id, Film.genre, Film.director, Film.status, Film.rating, Film.publication_year,
+                           Film.updated_at).where(Film.owner_id == self.owner_id).order_by(Film.id)
+        if since is not None:
+            statement = statement.where(queries.changed_since(since))
+        with self.session_scope() as session:
+            for partition in session.execute(statement.execution_options(yield_per=batch_size)).partitions():
+                yield from partition
+
+    def iter_sync_rows(self, since=None, batch_size=10000):
+        """
+        Yields (natural_key, content_hash, title, director, genre, status, rating,
+        publication_year, comments) rows, only those changed since when it is given; see
+        queries.changed_since.
+        """
+        statement = select(Film.natural_key, Film.content_hash, Film.title, Film.director, Film.genre, Film.status,
+                           Film.rating, Film.publication_year, Film.comments).where(Film.owner_id == self.owner_id)
+        if since is not None:
+            statement = statement.where(queries.changed_since(since))
+        with self.session_scope() as session:
+            for partition in session.execute(statement.execution_options(yield_per=batch_size)).partitions():
+                yield from partition
+
+    def get_change_signature(self):
+        """
+        Returns (film count, latest change time) from the owner's (owner_id, updated_at)
+        index. An edit committed late with an earlier time leaves it unchanged.
+        """
+        with self.session_scope() as session:
+            count, changed = session.query(func.count(Film.id), func.max(Film.updated_at)) \
+                .filter(Film.owner_id == self.owner_id).one()
+        return count, changed
+
+    def get_natural_keys(self):
+        with self.session_scope() as session:
+            return session.scalars(select(Film.natural_key).where(Film.owner_id == self.owner_id)).all()
+
+    def get_film_ids_by_keys(self, keys, chunk_size=1000):
+        keys = list(keys)
+        found = {}
+        with self.session_scope() as session:
+            for start in range(0, len(keys), chunk_size):
+                found.update(session.execute(select(Film.natural_key, Film.id).where(
+                    Film.owner_id == self.owner_id, Film.natural_key.in_(keys[start:start + chunk_size]))).all())
+        return found
+
+    def get_film_ids(self):
+        with self.session_scope() as session:
+            return session.scalars(select(Film.id).where(Film.owner_id == self.owner_id).order_by(Film.id)).all()
+
+    def get_watch_events(self, title=None, start=None, end=None, limit=None):
+        """
+        Returns (title, status, timestamp) tuples from the watch log, newest first.
+
+        Parameters
+        ----------
+        title : str, optional
+            Only return the history of this film.
+        start, end : datetime, optional
+            Only return events with start <= timestamp < end.
+        limit : int, optional
+            Maximum number of events.
+        """
+        with self.session_scope() as session:
+            film_id = None
+            if title is not None:
+                film_id = session.scalars(select(Film.id).where(Film.owner_id == self.owner_id, Film.title == title)
+                                          .limit(1)).first()
+                if film_id is None:
+                    raise ValueError(f"Film with title '{title}' not found.")
+            statement = queries.watch_events_select(self.owner_id, film_id, start, end, limit)
+            return [tuple(row) for row in session.execute(statement).all()]
 
     def get_all_films(self):
-        return self.session.query(Film).all()
+        with self.session_scope() as session:
+            return session.query(Film).filter(Film.owner_id == self.owner_id).all()
 
     def get_film_by_title(self, title):
-        return self.session.query(Film).filter(Film.title == title).first()
+        if self.write_queue is not None:
+            self.write_queue.wait_for_caller()
+        if self.film_cache is not None:
+            found, film = self.film_cache.lookup(("title", title))
+            if found:
+                return film
+        with self.session_scope() as session:
+            film = session.query(Film).filter(Film.owner_id == self.owner_id, Film.title == title).first()
+        self._cache_film(("title", title), film)
+        return film
+
+    def get_film_by_id(self, film_id):
+        if self.write_queue is not None:
+            self.write_queue.wait_for_caller()
+        if self.film_cache is not None:
+            found, film = self.film_cache.lookup(("id", film_id))
+            if found:
+                return film
+        with self.session_scope() as session:
+            film = session.get(Film, film_id)
+        if film is not None and film.owner_id != self.owner_id:
+            film = None
+        if film is not None:
+            self._cache_film(("id", film_id), film)
+        return film
 
     def get_watched_films(self):
-        return self.session.query(Film).filter(Film.status == 'watched').all()
\ No newline at end of file
+        with self.session_scope() as session:
+            return session.query(Film).filter(Film.owner_id == self.owner_id, Film.status == 'watched').all()
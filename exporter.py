@@ -0,0 +1,150 @@
+import csv
+import gzip
+import io
+import json
+from importer import chunked
+
+EXPORT_COLUMNS = ("title", "director", "genre", "status", "rating", "publication_year", "comments")
+FORMATS = ("text", "csv", "jsonl", "parquet")
+COMPRESSIONS = ("gzip", "zstd")
+_EXTENSIONS = {".txt": "text", ".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+_COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+BUFFER_SIZE = 1 << 20
+
+
+def detect_format(file_path):
+    """
+    Guesses the export format and compression from the file name.
+
+    'films.csv.gz' gives ('csv', 'gzip'); unknown extensions fall back to the text format.
+    """
+    name = file_path.lower()
+    compression = None
+    for extension, codec in _COMPRESSION_EXTENSIONS.items():
+        if name.endswith(extension):
+            compression = codec
+            name = name[:-len(extension)]
+    for extension, fmt in _EXTENSIONS.items():
+        if name.endswith(extension):
+            return fmt, compression
+    return "text", compression
+
+
+def open_output(file_path, compression=None):
+    """
+    Opens a buffered text stream for writing, compressing it when asked to.
+    """
+    if compression is None:
+        return open(file_path, 'w', buffering=BUFFER_SIZE, newline='')
+    if compression == "gzip":
+        return io.TextIOWrapper(io.BufferedWriter(gzip.open(file_path, 'wb', compresslevel=6), BUFFER_SIZE),
+                                newline='')
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the 'zstandard' package")
+        raw = open(file_path, 'wb')
+        writer = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(io.BufferedWriter(writer, BUFFER_SIZE), newline='')
+    raise ValueError(f"Compression must be one of {', '.join(COMPRESSIONS)}")
+
+
+def write_text(file, rows):
+    count = 0
+    for title, director, genre, status, rating, publication_year, comments in rows:
+        file.write(f"Title: {title}\n"
+                   f"Director: {director}\n"
+                   f"Genre: {genre}\n"
+                   f"Status: {status}\n"
+                   f"Rating: {rating}\n"
+                   f"Publication Year: {publication_year}\n"
+                   f"Comments: {comments}\n"
+                   "\n")
+        count += 1
+    return count
+
+
+def write_csv(file, rows):
+    writer = csv.writer(file)
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_jsonl(file, rows):
+    count = 0
+    for row in rows:
+        file.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))))
+        file.write("\n")
+        count += 1
+    return count
+
+
+def write_parquet(file_path, rows, compression=None, batch_size=10000):
+    """
+    Writes rows to a Parquet file one row group per batch.
+
+    Compression is applied by Parquet itself rather than by wrapping the file.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires the 'pyarrow' package")
+    schema = pa.schema([
+        ("title", pa.string()),
+        ("director", pa.string()),
+        ("genre", pa.string()),
+        ("status", pa.string()),
+        ("rating", pa.float64()),
+        ("publication_year", pa.int32()),
+        ("comments", pa.string())
+    ])
+    count = 0
+    with pq.ParquetWriter(file_path, schema, compression=compression or "none") as writer:
+        for batch in chunked(rows, batch_size):
+            columns = [list(column) for column in zip(*batch)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            count += len(batch)
+    return count
+
+
+def export_films(rows, file_path, fmt=None, compression=None, batch_size=10000):
+    """
+    Streams film rows into a file.
+
+    Parameters
+    ----------
+    rows : iterable of tuple
+        Rows in EXPORT_COLUMNS order, e.g. DatabaseManager.iter_film_rows().
+    file_path : str
+        Destination file.
+    fmt : str, optional
+        One of FORMATS. Detected from file_path when omitted.
+    compression : str, optional
+        'gzip' or 'zstd'. Detected from file_path when omitted.
+    batch_size : int
+        Rows per Parquet row group.
+
+    Returns
+    -------
+    int
+        The number of exported films.
+    """
+    detected_format, detected_compression = detect_format(file_path)
+    fmt = fmt or detected_format
+    compression = compression or detected_compression
+    if fmt not in FORMATS:
+        raise ValueError(f"Export format must be one of {', '.join(FORMATS)}")
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"Compression must be one of {', '.join(COMPRESSIONS)}")
+
+    if fmt == "parquet":
+        return write_parquet(file_path, rows, compression, batch_size)
+    writers = {"text": write_text, "csv": write_csv, "jsonl": write_jsonl}
+    with open_output(file_path, compression) as file:
+        return writers[fmt](file, rows)
@@ -0,0 +1,234 @@
+import glob
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from Film import validate_films
+
+
+class ImportReport:
+    """
+    Summary of a collection import.
+
+    Attributes
+    ----------
+    inserted : int
+        Number of new films written to the database.
+    updated : int
+        Number of existing films whose attributes changed and were rewritten.
+    unchanged : int
+        Number of films already stored with identical attributes, which were skipped.
+    rejected : list of tuple
+        (line_number, message) for every record that failed validation.
+    error : str or None
+        Why the import stopped early, if it did.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rejected = []
+        self.error = None
+
+    def reject(self, line_number, message):
+        self.rejected.append((line_number, message))
+
+    def record(self, results):
+        """Counts the (film_id, outcome) pairs returned by DatabaseManager.upsert_films."""
+        for _, outcome in results:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def __str__(self):
+        summary = (f"Imported {self.inserted} films, updated {self.updated}, unchanged {self.unchanged}, "
+                   f"rejected {len(self.rejected)}")
+        return f"{summary}, failed: {self.error}" if self.error else summary
+
+
+def parse_film_records(lines):
+    """
+    Parses 'Key: value' blocks separated by blank lines, one record at a time.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        An open collection file or any other iterable of lines.
+
+    Yields
+    ------
+    tuple
+        (line_number, record, error) where line_number is the first line of the block,
+        record maps normalised keys ('publication_year', ...) to raw string values and
+        error describes a malformed line, or is None.
+    """
+    record = {}
+    start = None
+    error = None
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line:
+            if start is None:
+                start = line_number
+            key, separator, value = line.partition(": ")
+            if separator:
+                record[key.lower().replace(" ", "_")] = value
+            elif error is None:
+                error = f"Malformed line {line_number}: '{line}'"
+        elif start is not None:
+            yield start, record, error
+            record = {}
+            start = None
+            error = None
+    if start is not None:
+        yield start, record, error
+
+
+def chunked(iterable, size):
+    """Yields lists of at most size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_chunk(chunk, report, current_year=None):
+    """
+    Validates a chunk of parsed records in one pass, recording rejects on the report.
+
+    Returns
+    -------
+    list of dict
+        Rows ready to be inserted.
+    """
+    candidates = []
+    for line_number, record, error in chunk:
+        if error:
+            report.reject(line_number, error)
+        else:
+            candidates.append((line_number, record))
+    rows, errors = validate_films(candidates, current_year)
+    report.rejected.extend(errors)
+    return rows
+
+
+def resolve_sources(source):
+    """
+    Expands a directory, a glob pattern or a single file into a sorted list of files.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def _parse_file(path, output, chunk_size, current_year):
+    """
+    Parses and validates one file in a worker process.
+
+    Validated chunks go to the output queue as ('rows', path, rows); a final
+    ('done', path, rejected, error) message closes the file.
+    """
+    report = ImportReport()
+    try:
+        with open(path, 'r') as file:
+            for chunk in chunked(parse_film_records(file), chunk_size):
+                rows = validate_chunk(chunk, report, current_year)
+                if rows:
+                    output.put(("rows", path, rows, None))
+    except Exception as e:
+        report.error = str(e)
+    output.put(("done", path, report.rejected, report.error))
+
+
+def import_files(source, write, workers=None, chunk_size=5000, commit_size=50000, queue_size=16, progress=None):
+    """
+    Imports many collection files, parsing them in a process pool.
+
+    Worker processes parse and validate the files and send validated chunks through
+    a bounded queue to this process. This process is the only database writer: it
+    passes at least commit_size rows at a time to write, one transaction per call.
+
+    Parameters
+    ----------
+    source : str
+        A directory, a glob pattern such as 'drops/*.txt', or a single file.
+    write : callable
+        Called with a list of rows; must upsert them in one transaction and return
+        their (film_id, outcome) pairs.
+    workers : int, optional
+        Number of parser processes. Defaults to the number of CPUs.
+    chunk_size : int
+        Records validated and sent per message.
+    commit_size : int
+        Rows buffered before they are written.
+    queue_size : int
+        Maximum number of chunks waiting for the writer.
+    progress : callable, optional
+        Called with (files_done, files_total, rows_written) after each file and write.
+
+    Returns
+    -------
+    dict
+        File path -> ImportReport.
+    """
+    paths = resolve_sources(source)
+    reports = {path: ImportReport() for path in paths}
+    if not paths:
+        return reports
+    current_year = datetime.now().year
+    buffer = []
+    segments = []
+    finished = set()
+    inserted = 0
+
+    def flush():
+        nonlocal inserted
+        if not buffer:
+            return
+        try:
+            results = write(buffer)
+        except Exception as e:
+            for path, _ in segments:
+                reports[path].error = f"Database write failed: {e}"
+        else:
+            start = 0
+            for path, count in segments:
+                reports[path].record(results[start:start + count])
+                start += count
+            inserted += len(buffer)
+        buffer.clear()
+        segments.clear()
+        if progress:
+            progress(len(finished), len(paths), inserted)
+
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        output = manager.Queue(queue_size)
+        futures = {path: pool.submit(_parse_file, path, output, chunk_size, current_year) for path in paths}
+        while len(finished) < len(paths):
+            try:
+                kind, path, payload, error = output.get(timeout=1)
+            except queue.Empty:
+                for path, future in futures.items():
+                    if path not in finished and future.done() and future.exception():
+                        reports[path].error = str(future.exception())
+                        finished.add(path)
+                continue
+            if kind == "rows":
+                buffer.extend(payload)
+                segments.append((path, len(payload)))
+                if len(buffer) >= commit_size:
+                    flush()
+            else:
+                reports[path].rejected.extend(payload)
+                reports[path].error = reports[path].error or error
+                finished.add(path)
+                if progress:
+                    progress(len(finished), len(paths), inserted)
+        flush()
+    return reports
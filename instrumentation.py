@@ -0,0 +1,226 @@
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import Film
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class OperationStats:
+    """
+    Latency histogram and SQL counters for one instrumented operation.
+
+    Statements and rows are counted inclusively: a CollectionManager call that goes
+    through DatabaseManager is charged for the SQL of both.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.statements = 0
+        self.rows_loaded = 0
+        self.rows_affected = 0
+
+    def record(self, seconds, statements, rows_loaded, rows_affected, failed):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        position = 0
+        while position < len(BUCKETS) and seconds > BUCKETS[position]:
+            position += 1
+        self.buckets[position] += 1
+        self.statements += statements
+        self.rows_loaded += rows_loaded
+        self.rows_affected += rows_affected
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction of calls, capped at
+        the slowest call seen so that no percentile exceeds max_seconds.
+        """
+        threshold = fraction * self.count
+        seen = 0
+        for position, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= threshold and bucket:
+                return min(BUCKETS[position], self.max) if position < len(BUCKETS) else self.max
+        return 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": round(self.total, 6),
+            "mean_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "max_seconds": round(self.max, 6),
+            "p50_seconds": self.percentile(0.5),
+            "p95_seconds": self.percentile(0.95),
+            "histogram": {f"<={bound}s": count for bound, count in zip(BUCKETS, self.buckets)}
+            | {f">{BUCKETS[-1]}s": self.buckets[-1]},
+            "statements": self.statements,
+            "rows_loaded": self.rows_loaded,
+            "rows_affected": self.rows_affected
+        }
+
+
+class Metrics:
+    """
+    Collects per-operation timings, SQL statement counts and a slow-query log.
+
+    Nothing is hooked until enable() is called, and instrument() only wraps the
+    instances it is given, so a process that never enables metrics pays nothing.
+
+    Attributes
+    ----------
+    slow_query_threshold : float
+        Statements taking at least this many seconds are logged.
+    operations : dict
+        Operation name -> OperationStats.
+    """
+
+    def __init__(self, slow_query_threshold=0.5, slow_query_log=None):
+        self.slow_query_threshold = slow_query_threshold
+        self.operations = {}
+        self.statements = 0
+        self.slow_queries = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.enabled = False
+        self.logger = logging.getLogger("watchlist.slow_queries")
+        if slow_query_log:
+            handler = logging.FileHandler(slow_query_log)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.WARNING)
+            self.logger.propagate = False
+
+    def enable(self):
+        if not self.enabled:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            event.listen(Film, "load", self._on_load)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", self._after_cursor_execute)
+            event.remove(Film, "load", self._on_load)
+            self.enabled = False
+
+    def _frames(self):
+        frames = getattr(self.local, "frames", None)
+        if frames is None:
+            frames = self.local.frames = []
+        return frames
+
+    def _before_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("watchlist_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info["watchlist_query_start"].pop()
+        affected = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        frames = self._frames()
+        for frame in frames:
+            frame[0] += 1
+            frame[2] += affected
+        with self.lock:
+            self.statements += 1
+        if seconds >= self.slow_query_threshold:
+            with self.lock:
+                self.slow_queries += 1
+            operation = frames[-1][3] if frames else "-"
+            self.logger.warning("%.3fs [%s] %s %s", seconds, operation, " ".join(statement.split()),
+                                repr(parameters)[:200])
+
+    def _on_load(self, target, context):
+        for frame in self._frames():
+            frame[1] += 1
+
+    def track(self, name, function):
+        """
+        Returns function wrapped so that its calls are recorded under name.
+        """
+        def finish(frame, start, failed):
+            seconds = time.perf_counter() - start
+            self._frames().remove(frame)
+            with self.lock:
+                stats = self.operations.get(name)
+                if stats is None:
+                    stats = self.operations[name] = OperationStats()
+                stats.record(seconds, frame[0], frame[1], frame[2], failed)
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                frame = [0, 0, 0, name]
+                self._frames().append(frame)
+                start = time.perf_counter()
+                failed = True
+                try:
+                    for item in function(*args, **kwargs):
+                        frame[1] += 1
+                        yield item
+                    failed = False
+                finally:
+                    finish(frame, start, failed)
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            frame = [0, 0, 0, name]
+            self._frames().append(frame)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                finish(frame, start, failed)
+        return wrapper
+
+    def instrument(self, target, prefix=None, exclude=("session_scope", "transaction")):
+        """
+        Wraps the public methods of target, e.g. a CollectionManager, on that instance only.
+
+        Rows yielded by generator methods count as loaded rows.
+        """
+        prefix = prefix or type(target).__name__
+        for name, member in inspect.getmembers(type(target), inspect.isfunction):
+            if not name.startswith("_") and name not in exclude:
+                setattr(target, name, self.track(f"{prefix}.{name}", getattr(target, name)))
+        return target
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "statements": self.statements,
+                "slow_queries": self.slow_queries,
+                "slow_query_threshold_seconds": self.slow_query_threshold,
+                "operations": {name: stats.to_dict() for name, stats in sorted(self.operations.items())}
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_text(self):
+        snapshot = self.snapshot()
+        lines = [f"SQL statements: {snapshot['statements']}, slow queries: {snapshot['slow_queries']} "
+                 f"(>= {self.slow_query_threshold * 1000:.0f} ms)",
+                 f"{'operation':<40} {'calls':>7} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9} "
+                 f"{'sql':>7} {'loaded':>8} {'changed':>8}"]
+        for name, stats in snapshot["operations"].items():
+            lines.append(f"{name:<40} {stats['count']:>7} {stats['mean_seconds'] * 1000:>9.2f} "
+                         f"{stats['p95_seconds'] * 1000:>9.2f} {stats['max_seconds'] * 1000:>9.2f} "
+                         f"{stats['statements']:>7} {stats['rows_loaded']:>8} {stats['rows_affected']:>8}")
+        return "\n".join(lines)
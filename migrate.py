@@ -0,0 +1,314 @@
+"""
+Brings an existing watchlist database up to the current schema.
+
+Base.metadata.create_all only creates missing tables; it never alters existing ones.
+A database created before the natural key, the per-owner partitioning and the
+updated_at watermark therefore needs this migration once. It
+
+- creates any missing table,
+- adds films.owner_id, natural_key, content_hash and updated_at, and watch_events.owner_id,
+- computes natural_key and content_hash for the existing films, in batches, and
+  stamps those without a change time with the time of the migration,
+- replaces the single-column indexes with the owner-leading ones, and the unique
+  natural key with a unique (owner_id, natural_key),
+- recreates genre_stats keyed on (owner_id, genre) and rebuilds it from the films.
+
+Every step inspects the schema first, so the migration can be run again, and an
+interrupted run resumes where it stopped. It supports SQLite and MSSQL. Films that
+would share an owner and natural key stop it before the unique constraint is added;
+remove the duplicates and run it again.
+
+Usage:
+    python migrate.py
+    python migrate.py --url sqlite:///watchlist.db --owner 7
+"""
+import argparse
+import sys
+from datetime import datetime
+from sqlalchemy import MetaData, Table, bindparam, create_engine, func, inspect, or_, select, update
+from sqlalchemy.schema import AddConstraint
+import config
+import queries
+from models import Base, Film, GenreStats, WatchEvent, content_hash, engine_options, natural_key
+
+NEW_COLUMNS = {
+    "films": ("owner_id", "natural_key", "content_hash", "updated_at"),
+    "watch_events": ("owner_id",)
+}
+LEGACY_INDEXES = {
+    "films": ("ix_films_title", "ix_films_director", "ix_films_genre", "ix_films_status", "ix_films_rating",
+              "ix_films_publication_year", "ix_films_updated_at", "ix_films_natural_key"),
+    "watch_events": ("ix_watch_events_ts",)
+}
+OWNER_KEY = "uq_films_owner_natural_key"
+
+
+def _column_ddl(dialect, column, owner_id):
+    ddl = f"{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}"
+    if column.name == "owner_id":
+        # The default fills in the existing rows as the column is added, so no separate
+        # update can be lost if the migration stops in between.
+        return f"{ddl} NOT NULL DEFAULT {int(owner_id)}"
+    return f"{ddl} NULL"
+
+
+def add_columns(connection, owner_id):
+    """
+    Adds the columns missing from films and watch_events. Existing films and watch
+    events go to owner_id.
+    """
+    steps = []
+    for table_name, names in NEW_COLUMNS.items():
+        table = Base.metadata.tables[table_name]
+        present = {column["name"] for column in inspect(connection).get_columns(table_name)}
+        for name in names:
+            if name not in present:
+                connection.exec_driver_sql(f"ALTER TABLE {table_name} "
+                                           f"ADD {_column_ddl(connection.dialect, table.c[name], owner_id)}")
+                steps.append(f"Added {table_name}.{name}")
+    return steps
+
+
+def backfill_keys(engine, changed_at, batch_size=10000):
+    """
+    Computes natural_key and content_hash for the films missing either, one transaction
+    per batch. Films without updated_at get changed_at, so the next incremental sync or
+    snapshot refresh reads them once instead of on every run.
+
+    Returns
+    -------
+    int
+        Number of films updated.
+    """
+    films = Film.__table__
+    statement = update(films).where(films.c.id == bindparam("film_id")) \
+        .values(natural_key=bindparam("key"), content_hash=bindparam("digest"),
+                updated_at=func.coalesce(films.c.updated_at, changed_at))
+    last_id = 0
+    count = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(films.c.id, films.c.title, films.c.director, films.c.genre, films.c.status, films.c.rating,
+                       films.c.publication_year, films.c.comments)
+                .where(films.c.id > last_id, or_(films.c.natural_key.is_(None), films.c.content_hash.is_(None),
+                                                 films.c.updated_at.is_(None)))
+                .order_by(films.c.id).limit(batch_size)).all()
+            if not rows:
+                return count
+            connection.execute(statement, [
+                {"film_id": row.id, "key": natural_key(row.title, row.director, row.publication_year),
+                 "digest": content_hash(row.title, row.director, row.genre, row.status, row.rating,
+                                        row.publication_year, row.comments)}
+                for row in rows])
+        last_id = rows[-1].id
+        count += len(rows)
+
+
+def find_duplicates(connection, limit=10):
+    """Returns up to limit lists of ids of films sharing an owner and natural key."""
+    films = Film.__table__
+    groups = connection.execute(
+        select(films.c.owner_id, films.c.natural_key).group_by(films.c.owner_id, films.c.natural_key)
+        .having(func.count(films.c.id) > 1).limit(limit)).all()
+    return [connection.scalars(select(films.c.id).where(films.c.owner_id == owner, films.c.natural_key == key)
+                               .order_by(films.c.id)).all()
+            for owner, key in groups]
+
+
+def _legacy_natural_key(connection):
+    """
+    Returns ('constraint', name) or ('index', name) for the unique key on natural_key
+    alone, or None when films has none.
+    """
+    inspector = inspect(connection)
+    for constraint in inspector.get_unique_constraints("films"):
+        if constraint["column_names"] == ["natural_key"]:
+            return "constraint", constraint["name"]
+    for index in inspector.get_indexes("films"):
+        if index["unique"] and index["column_names"] == ["natural_key"]:
+            return "index", index["name"]
+    return None
+
+
+def _rebuild_sqlite_films(connection):
+    """
+    Copies films into a table created from the model. SQLite can neither drop a
+    constraint nor make a column NOT NULL in place.
+    """
+    names = ", ".join(column.name for column in Film.__table__.columns)
+    rebuilt = Film.__table__.to_metadata(MetaData(), name="films_rebuilt")
+    rebuilt.indexes.clear()
+    connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+    rebuilt.create(connection)
+    connection.exec_driver_sql(f"INSERT INTO films_rebuilt ({names}) SELECT {names} FROM films")
+    connection.exec_driver_sql("DROP TABLE films")
+    connection.exec_driver_sql("ALTER TABLE films_rebuilt RENAME TO films")
+
+
+def update_films_table(connection):
+    """
+    Drops the legacy unique natural key and makes the columns match the model: NOT NULL
+    natural_key and updated_at and, outside SQLite, the bounded string lengths indexes
+    need. Indexes on an altered column are dropped first; create_indexes recreates them.
+    """
+    steps = []
+    legacy = _legacy_natural_key(connection)
+    inspector = inspect(connection)
+    columns = {column["name"]: column for column in inspector.get_columns("films")}
+    if connection.dialect.name == "sqlite":
+        if legacy is not None or columns["natural_key"]["nullable"] or columns["updated_at"]["nullable"]:
+            _rebuild_sqlite_films(connection)
+            steps.append("Rebuilt films with the current constraints")
+        return steps
+    preparer = connection.dialect.identifier_preparer
+    if legacy is not None:
+        kind, name = legacy
+        if kind == "index":
+            connection.exec_driver_sql(f"DROP INDEX {preparer.quote(name)} ON films")
+        else:
+            connection.exec_driver_sql(f"ALTER TABLE films DROP CONSTRAINT {preparer.quote(name)}")
+        steps.append(f"Dropped the unique natural key {name}")
+    altered = []
+    for column in Film.__table__.columns:
+        current = columns[column.name]
+        length = getattr(column.type, "length", None)
+        resize = length is not None and getattr(current["type"], "length", None) != length
+        if resize or current["nullable"] != column.nullable:
+            altered.append(column.name)
+    # SQL Server refuses to alter a column an index or constraint covers.
+    dropped = {legacy[1]} if legacy is not None else set()
+    for constraint in inspector.get_unique_constraints("films"):
+        if constraint["name"] not in dropped and set(altered) & set(constraint["column_names"]):
+            connection.exec_driver_sql(f"ALTER TABLE films DROP CONSTRAINT {preparer.quote(constraint['name'])}")
+            dropped.add(constraint["name"])
+            steps.append(f"Dropped constraint {constraint['name']} to alter its columns")
+    for index in inspector.get_indexes("films"):
+        if index["name"] not in dropped and set(altered) & set(index["column_names"]):
+            connection.exec_driver_sql(f"DROP INDEX {preparer.quote(index['name'])} ON films")
+            steps.append(f"Dropped index {index['name']} to alter its columns")
+    for name in altered:
+        column = Film.__table__.c[name]
+        connection.exec_driver_sql(f"ALTER TABLE films ALTER COLUMN {name} "
+                                   f"{column.type.compile(dialect=connection.dialect)} "
+                                   f"{'NULL' if column.nullable else 'NOT NULL'}")
+        steps.append(f"Altered films.{name}")
+    return steps
+
+
+def drop_legacy_indexes(connection):
+    """Drops the single-column indexes the owner-leading ones replace."""
+    steps = []
+    for table_name, legacy in LEGACY_INDEXES.items():
+        for index in Table(table_name, MetaData(), autoload_with=connection).indexes:
+            if index.name in legacy:
+                index.drop(connection)
+                steps.append(f"Dropped index {index.name}")
+    return steps
+
+
+def create_indexes(connection):
+    """Creates the indexes and the unique (owner_id, natural_key) the model declares."""
+    steps = []
+    inspector = inspect(connection)
+    present = {}
+    for table in (Film.__table__, WatchEvent.__table__):
+        names = present[table.name] = {index["name"] for index in inspector.get_indexes(table.name)}
+        names.update(constraint["name"] for constraint in inspector.get_unique_constraints(table.name))
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in names:
+                index.create(connection)
+                steps.append(f"Created index {index.name}")
+    if OWNER_KEY not in present["films"]:
+        constraint = next(constraint for constraint in Film.__table__.constraints if constraint.name == OWNER_KEY)
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql(f"CREATE UNIQUE INDEX {OWNER_KEY} ON films (owner_id, natural_key)")
+        else:
+            connection.execute(AddConstraint(constraint))
+        steps.append(f"Created unique constraint {OWNER_KEY}")
+    return steps
+
+
+def rebuild_genre_stats(connection):
+    """Recreates genre_stats if it is not keyed on (owner_id, genre), then rebuilds it for every owner."""
+    steps = []
+    key = inspect(connection).get_pk_constraint("genre_stats")["constrained_columns"]
+    if sorted(key) != ["genre", "owner_id"]:
+        Table("genre_stats", MetaData(), autoload_with=connection).drop(connection)
+        GenreStats.__table__.create(connection)
+        steps.append("Recreated genre_stats keyed on (owner_id, genre)")
+    connection.execute(GenreStats.__table__.delete())
+    owners = connection.scalars(select(Film.owner_id).distinct()).all()
+    for owner_id in owners:
+        connection.execute(queries.rebuild_stats_insert(owner_id))
+    steps.append(f"Rebuilt genre_stats for {len(owners)} owners")
+    return steps
+
+
+def migrate(url=None, owner_id=None, batch_size=10000):
+    """
+    Migrates the database at url (default: WATCHLIST_DATABASE_URL) to the current schema.
+
+    Parameters
+    ----------
+    owner_id : int, optional
+        Owner of the films that predate owner_id. Defaults to WATCHLIST_OWNER_ID.
+    batch_size : int
+        Films whose keys are computed per transaction.
+
+    Returns
+    -------
+    list of str
+        The steps taken.
+    """
+    url = url or config.DATABASE_URL
+    owner_id = config.OWNER_ID if owner_id is None else owner_id
+    engine = create_engine(url, **engine_options(url))
+    started = datetime.now()
+    try:
+        with engine.begin() as connection:
+            missing = [table for table in Base.metadata.sorted_tables
+                       if not inspect(connection).has_table(table.name)]
+            Base.metadata.create_all(connection, tables=missing)
+            steps = [f"Created table {table.name}" for table in missing]
+            steps += add_columns(connection, owner_id)
+        updated = backfill_keys(engine, started, batch_size)
+        if updated:
+            steps.append(f"Computed natural_key, content_hash and updated_at for {updated} films")
+        with engine.begin() as connection:
+            duplicates = find_duplicates(connection)
+        if duplicates:
+            raise ValueError("Films with the same owner, title, director and year must be merged first; "
+                             f"duplicate ids: {'; '.join(', '.join(map(str, ids)) for ids in duplicates)}")
+        with engine.begin() as connection:
+            steps += drop_legacy_indexes(connection)
+            steps += update_films_table(connection)
+        with engine.begin() as connection:
+            steps += create_indexes(connection)
+        with engine.begin() as connection:
+            steps += rebuild_genre_stats(connection)
+    finally:
+        engine.dispose()
+    return steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate an existing watchlist database to the current schema.")
+    parser.add_argument("--url", help="database URL (default: WATCHLIST_DATABASE_URL)")
+    parser.add_argument("--owner", type=int,
+                        help="user who owns the films that predate per-user collections (default: WATCHLIST_OWNER_ID)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="films whose keys are computed per transaction")
+    args = parser.parse_args(argv)
+    try:
+        steps = migrate(args.url, args.owner, args.batch_size)
+    except ValueError as e:
+        print(f"Migration stopped: {e}", file=sys.stderr)
+        return 1
+    for step in steps:
+        print(step, file=sys.stderr)
+    print("Schema is up to date.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import base64
+import binascii
+import json
+
+
+class Page:
+    """
+    One page of films from a keyset-paginated listing.
+
+    Attributes
+    ----------
+    films : list
+        The films on this page, in display order.
+    next_cursor : str or None
+        Cursor for the following page, or None on the last page.
+    previous_cursor : str or None
+        Cursor for the preceding page, or None on the first page.
+    """
+
+    def __init__(self, films, next_cursor=None, previous_cursor=None):
+        self.films = films
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.films)
+
+    def __len__(self):
+        return len(self.films)
+
+
+def encode_cursor(sort_by, value, film_id, direction):
+    """
+    Encodes a page boundary as an opaque, URL-safe string.
+
+    Parameters
+    ----------
+    sort_by : str
+        The sort key the listing uses.
+    value
+        The sort key value of the boundary film.
+    film_id : int
+        The id of the boundary film, which breaks ties between equal sort values.
+    direction : str
+        'next' to continue after the boundary, 'previous' to go back before it.
+    """
+    payload = json.dumps([sort_by, value, film_id, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_by):
+    """
+    Decodes a cursor made by encode_cursor.
+
+    Returns
+    -------
+    tuple
+        (value, film_id, direction).
+
+    Raises
+    ------
+    ValueError
+        If the cursor is malformed or was made for a different sort key.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort_by, value, film_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Invalid page cursor")
+    if cursor_sort_by != sort_by or direction not in ("next", "previous") or not isinstance(film_id, int):
+        raise ValueError("Invalid page cursor")
+    return value, film_id, direction
@@ -0,0 +1,481 @@
+"""
+Statements and session-level operations shared by DatabaseManager and AsyncDatabaseManager.
+
+The write operations take a synchronous Session, so the async manager runs them through
+AsyncSession.run_sync, followed by the owner and whether to maintain genre_stats. Each
+returns (result, changes), where changes is None when nothing was written, or the
+(titles, ids) whose cached films the write made stale.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+import config
+from models import Film, GenreStats, WatchEvent, content_hash, natural_key
+from pagination import Page, decode_cursor, encode_cursor
+
+SORT_COLUMNS = {
+    "title": Film.title,
+    "rating": Film.rating,
+    "year": Film.publication_year,
+    "genre": Film.genre
+}
+
+SEARCH_FIELDS = {"title", "genre", "director", "rating", "publication_year"}
+EDITABLE_FIELDS = {"title", "director", "genre", "status", "rating", "publication_year", "comments"}
+KEY_FIELDS = {"title", "director", "publication_year"}
+# Text criteria are resolved to an IN over the matching values while the owner has at most
+# DISTINCT_LIMIT distinct values in the column and at most MATCH_LIMIT of them match.
+DISTINCT_LIMIT = 5000
+MATCH_LIMIT = 500
+
+
+def add_stats_delta(deltas, genre, status, rating, sign):
+    delta = deltas.setdefault(genre, [0, 0, 0, 0.0])
+    delta[0] += sign
+    delta[1] += sign if status == 'watched' else 0
+    delta[2] += sign if status == 'unwatched' else 0
+    delta[3] += sign * rating
+
+
+def stats_update(owner_id, genre, delta):
+    count, watched, unwatched, rating_sum = delta
+    return update(GenreStats) \
+        .where(GenreStats.owner_id == owner_id, GenreStats.genre == genre) \
+        .values(film_count=GenreStats.film_count + count,
+                watched_count=GenreStats.watched_count + watched,
+                unwatched_count=GenreStats.unwatched_count + unwatched,
+                rating_sum=GenreStats.rating_sum + rating_sum)
+
+
+def apply_film_changes(film, new_title, new_director, new_genre, new_status, new_rating, new_publication_year,
+                       new_comments):
+    if new_title:
+        film.title = new_title
+    if new_director:
+        film.director = new_director
+    if new_genre:
+        film.genre = new_genre
+    if new_status:
+        film.status = new_status
+    if new_rating is not None:
+        film.rating = new_rating
+    if new_publication_year is not None:
+        film.publication_year = new_publication_year
+    if new_comments:
+        film.comments = new_comments
+
+
+def keyed_row(film, owner_id):
+    row = dict(film, owner_id=owner_id)
+    row.setdefault("comments", "No comments")
+    row["natural_key"] = natural_key(row["title"], row["director"], row["publication_year"])
+    row["content_hash"] = content_hash(row["title"], row["director"], row["genre"], row["status"], row["rating"],
+                                       row["publication_year"], row["comments"])
+    return row
+
+
+def refresh_keys(film):
+    film.natural_key = natural_key(film.title, film.director, film.publication_year)
+    film.content_hash = content_hash(film.title, film.director, film.genre, film.status, film.rating,
+                                     film.publication_year, film.comments)
+
+
+def existing_films_select(owner_id, keys):
+    return select(Film.id, Film.natural_key, Film.content_hash, Film.title, Film.genre, Film.status,
+                  Film.rating).where(Film.owner_id == owner_id, Film.natural_key.in_(keys))
+
+
+def plan_upsert(rows, existing):
+    """
+    Sorts keyed rows into inserts, updates and unchanged films.
+
+    When a batch repeats a natural key, only its last row is written.
+
+    Returns
+    -------
+    tuple
+        (results, inserts, updates): results has a (film_id, outcome) slot per row, filled
+        for unchanged rows; inserts lists row positions; updates lists (position, existing row).
+    """
+    latest = {row["natural_key"]: position for position, row in enumerate(rows)}
+    results = [None] * len(rows)
+    inserts = []
+    updates = []
+    for key, position in latest.items():
+        current = existing.get(key)
+        if current is None:
+            inserts.append(position)
+        elif current.content_hash == rows[position]["content_hash"]:
+            results[position] = (current.id, "unchanged")
+        else:
+            updates.append((position, current))
+    return results, inserts, updates
+
+
+def finish_upsert(rows, results, inserts, inserted_ids, updates):
+    """
+    Fills in the results of written rows and collects the watch events and genre_stats
+    deltas the writes imply.
+    """
+    events = []
+    deltas = {}
+    now = datetime.now()
+    for position, film_id in zip(inserts, inserted_ids):
+        row = rows[position]
+        results[position] = (film_id, "inserted")
+        add_stats_delta(deltas, row["genre"], row["status"], row["rating"], 1)
+        if row["status"] == 'watched':
+            events.append({"owner_id": row["owner_id"], "film_id": film_id, "status": 'watched', "ts": now})
+    for position, current in updates:
+        row = rows[position]
+        results[position] = (current.id, "updated")
+        add_stats_delta(deltas, current.genre, current.status, current.rating, -1)
+        add_stats_delta(deltas, row["genre"], row["status"], row["rating"], 1)
+        if row["status"] != current.status:
+            events.append({"owner_id": row["owner_id"], "film_id": current.id, "status": row["status"], "ts": now})
+    written = {rows[position]["natural_key"]: result[0] for position, result in enumerate(results) if result}
+    for position, row in enumerate(rows):
+        if results[position] is None:
+            results[position] = (written[row["natural_key"]], "unchanged")
+    return events, {genre: delta for genre, delta in deltas.items() if any(delta)}
+
+
+def bulk_stats_deltas(rows, values, sign):
+    """
+    Turns per-genre aggregates of the rows a bulk operation touches into genre_stats deltas.
+
+    With sign=-1 the rows are only subtracted (a delete). Otherwise they are subtracted
+    and added back with the new values applied, which is exact because a bulk update
+    assigns the same values to every matched row.
+    """
+    deltas = {}
+    for genre, count, watched, unwatched, rating_sum in rows:
+        old = deltas.setdefault(genre, [0, 0, 0, 0.0])
+        old[0] -= count
+        old[1] -= watched
+        old[2] -= unwatched
+        old[3] -= rating_sum
+        if sign < 0:
+            continue
+        if "status" in values:
+            watched = count if values["status"] == 'watched' else 0
+            unwatched = count if values["status"] == 'unwatched' else 0
+        if "rating" in values:
+            rating_sum = count * values["rating"]
+        new = deltas.setdefault(values.get("genre", genre), [0, 0, 0, 0.0])
+        new[0] += count
+        new[1] += watched
+        new[2] += unwatched
+        new[3] += rating_sum
+    return {genre: delta for genre, delta in deltas.items() if any(delta)}
+
+
+def _genre_aggregates():
+    return (
+        func.count(Film.id),
+        func.sum(case((Film.status == 'watched', 1), else_=0)),
+        func.sum(case((Film.status == 'unwatched', 1), else_=0)),
+        func.sum(Film.rating)
+    )
+
+
+def genre_aggregate_select(owner_id):
+    return select(Film.genre, *_genre_aggregates()).where(Film.owner_id == owner_id).group_by(Film.genre)
+
+
+def genre_stats_select(owner_id):
+    return select(GenreStats.genre, GenreStats.film_count, GenreStats.watched_count,
+                  GenreStats.unwatched_count, GenreStats.rating_sum) \
+        .where(GenreStats.owner_id == owner_id, GenreStats.film_count > 0)
+
+
+def rebuild_stats_insert(owner_id):
+    return insert(GenreStats).from_select(
+        ["owner_id", "genre", "film_count", "watched_count", "unwatched_count", "rating_sum"],
+        select(Film.owner_id, Film.genre, *_genre_aggregates())
+        .where(Film.owner_id == owner_id).group_by(Film.owner_id, Film.genre)
+    )
+
+
+def statistics_from_rows(rows):
+    rows = sorted(rows, key=lambda row: (-row[1], row[0]))
+    total_films = sum(row[1] for row in rows)
+    watched_count = sum(row[2] for row in rows)
+    most_watched = min(rows, key=lambda row: (-row[2], row[0])) if watched_count else None
+    return {
+        "total_films": total_films,
+        "genre_count": {row[0]: row[1] for row in rows},
+        "average_rating": sum(row[4] for row in rows) / total_films if total_films else 0,
+        "watched_count": watched_count,
+        "unwatched_count": sum(row[3] for row in rows),
+        "most_watched_genre": most_watched[0] if most_watched else None
+    }
+
+
+def resolve_text_values(session, owner_id, genre, director, substring=True):
+    """
+    Looks up the owner's genres and directors that contain the searched ones, or equal them
+    without substring, ignoring case. A LIKE on lower(column) cannot use the (owner_id,
+    genre) and (owner_id, director) indexes; an IN over the matching values seeks them.
+    The distinct values are read from the same indexes.
+
+    Returns
+    -------
+    dict
+        Column name -> matching values. A column with too many distinct or matching values
+        is left out, and its criterion stays a LIKE.
+    """
+    resolved = {}
+    for column, value in ((Film.genre, genre), (Film.director, director)):
+        if not value:
+            continue
+        values = session.scalars(select(column).where(Film.owner_id == owner_id).distinct()
+                                 .limit(DISTINCT_LIMIT + 1)).all()
+        query = value.lower()
+        matches = [candidate for candidate in values
+                   if (query in candidate.lower() if substring else candidate.lower() == query)]
+        if len(values) <= DISTINCT_LIMIT and len(matches) <= MATCH_LIMIT:
+            resolved[column.key] = matches
+    return resolved
+
+
+def _text_criterion(column, value, resolved, substring):
+    if resolved and column.key in resolved:
+        return column.in_(resolved[column.key])
+    if substring:
+        return func.lower(column).contains(value.lower(), autoescape=True)
+    return func.lower(column) == value.lower()
+
+
+def search_criteria(title, genre, director, rating, publication_year, match_all, resolved=None):
+    criteria = []
+    for column, value in ((Film.title, title), (Film.genre, genre), (Film.director, director)):
+        if value:
+            criteria.append(_text_criterion(column, value, resolved, True))
+    if rating is not None:
+        criteria.append(Film.rating == rating)
+    if publication_year:
+        criteria.append(Film.publication_year == publication_year)
+    if not criteria:
+        return None
+    return and_(*criteria) if match_all else or_(*criteria)
+
+
+def exact_criteria(title, genre, director, rating, publication_year, resolved=None):
+    criteria = []
+    for column, value in ((Film.title, title), (Film.genre, genre), (Film.director, director)):
+        if value:
+            criteria.append(_text_criterion(column, value, resolved, False))
+    if rating is not None:
+        criteria.append(Film.rating == rating)
+    if publication_year:
+        criteria.append(Film.publication_year == publication_year)
+    return and_(*criteria) if criteria else None
+
+
+def page_select(owner_id, sort_by, page_size, cursor, descending, status):
+    """
+    Builds the keyset query for one page.
+
+    Returns
+    -------
+    tuple
+        (statement, backward) where backward tells whether the cursor points to a previous page.
+    """
+    if sort_by not in SORT_COLUMNS:
+        raise ValueError(f"Sort key must be one of {', '.join(SORT_COLUMNS)}")
+    if page_size < 1:
+        raise ValueError("Page size must be a positive integer")
+    column = SORT_COLUMNS[sort_by]
+    statement = select(Film).where(Film.owner_id == owner_id)
+    if status:
+        statement = statement.where(Film.status == status)
+    backward = False
+    if cursor:
+        value, film_id, direction = decode_cursor(cursor, sort_by)
+        backward = direction == "previous"
+    scan_ascending = descending == backward
+    if cursor:
+        if scan_ascending:
+            statement = statement.where(or_(column > value, and_(column == value, Film.id > film_id)))
+        else:
+            statement = statement.where(or_(column < value, and_(column == value, Film.id < film_id)))
+    if scan_ascending:
+        statement = statement.order_by(column.asc(), Film.id.asc())
+    else:
+        statement = statement.order_by(column.desc(), Film.id.desc())
+    return statement.limit(page_size + 1), backward
+
+
+def page_from_films(films, sort_by, page_size, cursor, backward):
+    key = SORT_COLUMNS[sort_by].key
+    has_more = len(films) > page_size
+    films = films[:page_size]
+    if backward:
+        films.reverse()
+    if not films:
+        return Page([])
+    first, last = films[0], films[-1]
+    next_cursor = previous_cursor = None
+    if has_more or backward:
+        next_cursor = encode_cursor(sort_by, getattr(last, key), last.id, "next")
+    if has_more if backward else cursor:
+        previous_cursor = encode_cursor(sort_by, getattr(first, key), first.id, "previous")
+    return Page(films, next_cursor, previous_cursor)
+
+
+def changed_since(since):
+    """
+    Matches the films changed at or after since, less CHANGE_OVERLAP seconds. A writer
+    stamps updated_at before it commits, so a film can become visible after a reader has
+    already seen later stamps; the overlap reads it again on the next pass, and callers
+    drop the rows they already have by id or content hash.
+    """
+    return Film.updated_at >= since - timedelta(seconds=config.CHANGE_OVERLAP)
+
+
+def watch_events_select(owner_id, film_id, start, end, limit):
+    statement = select(Film.title, WatchEvent.status, WatchEvent.ts).join(Film, Film.id == WatchEvent.film_id) \
+        .where(WatchEvent.owner_id == owner_id)
+    if film_id is not None:
+        statement = statement.where(WatchEvent.film_id == film_id)
+    if start is not None:
+        statement = statement.where(WatchEvent.ts >= start)
+    if end is not None:
+        statement = statement.where(WatchEvent.ts < end)
+    statement = statement.order_by(WatchEvent.ts.desc(), WatchEvent.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def apply_stats(session, owner_id, deltas):
+    """
+    Adds per-genre deltas to genre_stats. A genre's first row is inserted in a savepoint;
+    if a concurrent transaction inserted it first, the insert fails on the primary key
+    and the delta goes to that row instead.
+    """
+    for genre, delta in deltas.items():
+        if session.execute(stats_update(owner_id, genre, delta)).rowcount:
+            continue
+        count, watched, unwatched, rating_sum = delta
+        try:
+            with session.begin_nested():
+                session.execute(insert(GenreStats).values(owner_id=owner_id, genre=genre, film_count=count,
+                                                          watched_count=watched, unwatched_count=unwatched,
+                                                          rating_sum=rating_sum))
+        except IntegrityError:
+            session.execute(stats_update(owner_id, genre, delta))
+
+
+def find_film(session, owner_id, title):
+    film = session.scalars(select(Film).where(Film.owner_id == owner_id, Film.title == title).limit(1)).first()
+    if film is None:
+        raise ValueError(f"Film with title '{title}' not found.")
+    return film
+
+
+def search_films(session, owner_id, title, genre, director, rating, publication_year, match_all):
+    resolved = resolve_text_values(session, owner_id, genre, director)
+    criteria = search_criteria(title, genre, director, rating, publication_year, match_all, resolved)
+    if criteria is None:
+        return []
+    return session.scalars(select(Film).where(Film.owner_id == owner_id, criteria)).all()
+
+
+def add_film(session, owner_id, stats, title, director, genre, status, rating, publication_year, comments):
+    """
+    Adds a film, or updates the film with the same title, director and year.
+
+    Nothing is written when that film already has identical attributes.
+    """
+    row = keyed_row({"title": title, "director": director, "genre": genre, "status": status, "rating": rating,
+                     "publication_year": publication_year, "comments": comments}, owner_id)
+    film = session.scalars(select(Film).where(Film.owner_id == owner_id,
+                                              Film.natural_key == row["natural_key"])).first()
+    if film is not None and film.content_hash == row["content_hash"]:
+        return film.id, None
+    deltas = {}
+    if film is None:
+        film = Film(**row)
+        session.add(film)
+        old_title, old_status = title, 'unwatched'
+    else:
+        add_stats_delta(deltas, film.genre, film.status, film.rating, -1)
+        old_title, old_status = film.title, film.status
+        for name, value in row.items():
+            setattr(film, name, value)
+    add_stats_delta(deltas, genre, status, rating, 1)
+    if stats:
+        apply_stats(session, owner_id, {genre: delta for genre, delta in deltas.items() if any(delta)})
+    session.flush()
+    film_id = film.id
+    if status != old_status:
+        session.add(WatchEvent(owner_id=owner_id, film_id=film_id, status=status, ts=datetime.now()))
+    return film_id, ({title, old_title}, [film_id])
+
+
+def upsert_films(session, owner_id, stats, films, chunk_size=1000):
+    """
+    Inserts new films and updates changed ones, matching on the natural key (title,
+    director and year). Films whose stored content hash is unchanged are not written.
+
+    The result is a (film_id, outcome) per film, where outcome is 'inserted', 'updated'
+    or 'unchanged'.
+    """
+    if not films:
+        return [], None
+    rows = [keyed_row(film, owner_id) for film in films]
+    keys = list({row["natural_key"] for row in rows})
+    existing = {}
+    for start in range(0, len(keys), chunk_size):
+        existing.update((row.natural_key, row)
+                        for row in session.execute(existing_films_select(owner_id, keys[start:start + chunk_size])))
+    results, inserts, updates = plan_upsert(rows, existing)
+    inserted_ids = []
+    if inserts:
+        inserted_ids = session.scalars(insert(Film).returning(Film.id, sort_by_parameter_order=True),
+                                       [rows[position] for position in inserts]).all()
+    if updates:
+        session.execute(update(Film), [dict(rows[position], id=current.id) for position, current in updates])
+    events, deltas = finish_upsert(rows, results, inserts, inserted_ids, updates)
+    if events:
+        session.execute(insert(WatchEvent), events)
+    if stats:
+        apply_stats(session, owner_id, deltas)
+    if not (inserts or updates):
+        return results, None
+    titles = {rows[position]["title"] for position in inserts} | {rows[position]["title"] for position, _ in updates}
+    titles |= {current.title for _, current in updates}
+    return results, (titles, [current.id for _, current in updates])
+
+
+def remove_film(session, owner_id, stats, title):
+    film = find_film(session, owner_id, title)
+    film_id = film.id
+    deltas = {}
+    add_stats_delta(deltas, film.genre, film.status, film.rating, -1)
+    if stats:
+        apply_stats(session, owner_id, deltas)
+    session.execute(delete(WatchEvent).where(WatchEvent.film_id == film_id))
+    session.delete(film)
+    return film_id, ([title], [film_id])
+
+
+def edit_film(session, owner_id, stats, title, new_title, new_director, new_genre, new_status, new_rating,
+              new_publication_year, new_comments):
+    film = find_film(session, owner_id, title)
+    deltas = {}
+    add_stats_delta(deltas, film.genre, film.status, film.rating, -1)
+    if new_status and new_status != film.status:
+        session.add(WatchEvent(owner_id=owner_id, film_id=film.id, status=new_status, ts=datetime.now()))
+    apply_film_changes(film, new_title, new_director, new_genre, new_status, new_rating, new_publication_year,
+                       new_comments)
+    refresh_keys(film)
+    if session.scalar(select(Film.id).where(Film.owner_id == owner_id, Film.natural_key == film.natural_key,
+                                            Film.id != film.id)):
+        raise ValueError(f"Film '{film.title}' by {film.director} ({film.publication_year}) already exists.")
+    add_stats_delta(deltas, film.genre, film.status, film.rating, 1)
+    if stats:
+        apply_stats(session, owner_id, {genre: delta for genre, delta in deltas.items() if any(delta)})
+    return film, ({title, film.title}, [film.id])
@@ -0,0 +1,188 @@
+import numpy as np
+
+WEIGHTS = {"genre": 1.0, "director": 1.0, "decade": 0.5, "rating": 0.5, "history": 0.5}
+
+
+class SimilarityIndex:
+    """
+    An in-memory feature matrix for "similar films" queries.
+
+    Every film is a row of NumPy columns: dictionary-encoded genre and director,
+    decade, rating and watched flag. A query first scores each genre, director and
+    decade once into small lookup tables, then scores all rows in one vectorised
+    pass of table lookups and picks the best k with argpartition. Rows and the
+    watched counts are updated in place as films change.
+
+    Attributes
+    ----------
+    size : int
+        Number of indexed films; the columns hold size rows followed by spare capacity.
+    positions : dict
+        Film id -> row.
+    genre_codes, director_codes : dict
+        Lowercased genre or director -> integer code.
+    watched_genres, watched_directors : numpy.ndarray
+        Number of watched films per genre or director code.
+    watched_total : int
+        Number of watched films.
+    """
+    COLUMNS = (("ids", np.int64), ("genres", np.int32), ("directors", np.int32), ("decades", np.int16),
+               ("ratings", np.float32), ("watched", np.bool_))
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.positions = {}
+        self.genre_codes = {}
+        self.director_codes = {}
+        self.watched_genres = np.zeros(64, dtype=np.int64)
+        self.watched_directors = np.zeros(64, dtype=np.int64)
+        self.watched_total = 0
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.zeros(max(capacity, 1), dtype=dtype))
+
+    @staticmethod
+    def _code(codes, value):
+        return codes.setdefault(value.lower(), len(codes))
+
+    def _grow(self):
+        for name, dtype in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(len(column) * 2, dtype=dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def _count_watched(self, position, sign):
+        if not self.watched[position]:
+            return
+        for name, code in (("watched_genres", self.genres[position]),
+                           ("watched_directors", self.directors[position])):
+            counts = getattr(self, name)
+            if code >= len(counts):
+                counts = np.concatenate([counts, np.zeros(max(len(counts), code + 1), dtype=np.int64)])
+                setattr(self, name, counts)
+            counts[code] += sign
+        self.watched_total += sign
+
+    @staticmethod
+    def _history_table(counts, size, history):
+        table = np.zeros(size, dtype=np.float32)
+        table[:min(size, len(counts))] = history * counts[:size]
+        return table
+
+    def set(self, film_id, director, genre, status, rating, publication_year):
+        """
+        Adds a film, or overwrites its row if it is already indexed.
+        """
+        position = self.positions.get(film_id)
+        if position is None:
+            if self.size == len(self.ids):
+                self._grow()
+            position = self.positions[film_id] = self.size
+            self.ids[position] = film_id
+            self.size += 1
+        else:
+            self._count_watched(position, -1)
+        self.genres[position] = self._code(self.genre_codes, genre)
+        self.directors[position] = self._code(self.director_codes, director)
+        self.decades[position] = publication_year // 10
+        self.ratings[position] = rating
+        self.watched[position] = status == 'watched'
+        self._count_watched(position, 1)
+
+    def remove(self, film_id):
+        """
+        Drops a film by moving the last row into its place.
+        """
+        position = self.positions.pop(film_id, None)
+        if position is None:
+            return
+        self._count_watched(position, -1)
+        last = self.size - 1
+        if position != last:
+            for name, _ in self.COLUMNS:
+                column = getattr(self, name)
+                column[position] = column[last]
+            self.positions[int(self.ids[position])] = position
+        self.size = last
+
+    def similar(self, film_id, k=10, weights=None, use_history=True, unwatched_only=False):
+        """
+        Returns the k films most similar to film_id.
+
+        The score adds up weighted genre and director matches, closeness of decade
+        (1 / (1 + decades apart)) and of rating (1 - difference / 10). With use_history,
+        films also earn the share of watched films that have their genre and director,
+        which leans the results towards what the user actually watches.
+
+        Parameters
+        ----------
+        weights : dict, optional
+            Overrides for WEIGHTS ('genre', 'director', 'decade', 'rating', 'history').
+
+        Returns
+        -------
+        list of tuple
+            (film_id, score), best first and by id among equal scores. The film itself
+            is never included.
+
+        Raises
+        ------
+        ValueError
+            If film_id is not indexed.
+        """
+        position = self.positions.get(film_id)
+        if position is None:
+            raise ValueError(f"Film {film_id} is not in the similarity index.")
+        weights = dict(WEIGHTS, **(weights or {}))
+        history = weights["history"] / self.watched_total if use_history and self.watched_total else 0.0
+        genre_table = self._history_table(self.watched_genres, len(self.genre_codes), history)
+        genre_table[self.genres[position]] += weights["genre"]
+        director_table = self._history_table(self.watched_directors, len(self.director_codes), history)
+        director_table[self.directors[position]] += weights["director"]
+        decades_apart = np.abs(np.arange(np.iinfo(np.int16).max // 10 + 1) - self.decades[position])
+        decade_table = (weights["decade"] / (1 + decades_apart)).astype(np.float32)
+
+        count = self.size
+        scores = genre_table[self.genres[:count]]
+        scores += director_table[self.directors[:count]]
+        scores += decade_table[self.decades[:count]]
+        rating_gap = self.ratings[:count] - self.ratings[position]
+        np.abs(rating_gap, out=rating_gap)
+        rating_gap *= np.float32(weights["rating"] / 10)
+        scores += np.float32(weights["rating"])
+        scores -= rating_gap
+        scores[position] = -np.inf
+        if unwatched_only:
+            scores[self.watched[:count]] = -np.inf
+        k = min(k, count - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, count - k)[count - k:]
+        top = top[np.lexsort((self.ids[top], -scores[top]))]
+        return [(int(self.ids[row]), float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+    @classmethod
+    def build(cls, rows):
+        """
+        Builds an index from (film_id, director, genre, status, rating, publication_year) rows.
+        """
+        rows = list(rows)
+        index = cls(max(len(rows), 1024))
+        if not rows:
+            return index
+        ids, directors, genres, statuses, ratings, years = zip(*rows)
+        count = len(rows)
+        index.ids[:count] = ids
+        index.directors[:count] = [cls._code(index.director_codes, director) for director in directors]
+        index.genres[:count] = [cls._code(index.genre_codes, genre) for genre in genres]
+        index.decades[:count] = np.asarray(years) // 10
+        index.ratings[:count] = ratings
+        index.watched[:count] = np.asarray(statuses) == 'watched'
+        index.positions = dict(zip(ids, range(count)))
+        index.size = count
+        watched = index.watched[:count]
+        index.watched_genres = np.bincount(index.genres[:count][watched], minlength=max(len(index.genre_codes), 64))
+        index.watched_directors = np.bincount(index.directors[:count][watched],
+                                              minlength=max(len(index.director_codes), 64))
+        index.watched_total = int(watched.sum())
+        return index
@@ -0,0 +1,245 @@
+"""
+Columnar, memory-mappable snapshots of the film collection for offline analytics.
+
+A snapshot directory holds a manifest.json and one generation subdirectory of .npy
+columns: id (int64), genre and director (int32 dictionary codes), status (int8
+dictionary codes), rating (float32) and publication_year (int16). The dictionaries
+live in the manifest. Readers map the columns with numpy.load(mmap_mode='r'), so any
+number of processes share the same pages of the OS cache instead of copying them.
+
+A snapshot holds one user's collection, recorded as owner_id in the manifest.
+A refresh only reads films changed since the previous snapshot's watermark, plus the
+list of ids to drop deleted films, and writes a new generation before switching the
+manifest to it; readers that already mapped the old generation keep working.
+
+Usage:
+    python snapshot.py snapshots/collection
+    python snapshot.py snapshots/collection --full
+    python snapshot.py snapshots/user-7 --owner 7
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+import numpy as np
+
+MANIFEST = "manifest.json"
+COLUMNS = {
+    "id": np.int64,
+    "genre": np.int32,
+    "director": np.int32,
+    "status": np.int8,
+    "rating": np.float32,
+    "publication_year": np.int16
+}
+DICTIONARY_COLUMNS = ("genre", "director", "status")
+
+
+class Snapshot:
+    """
+    A read-only view of a snapshot directory.
+
+    Attributes
+    ----------
+    columns : dict
+        Column name -> numpy array, memory-mapped unless loaded with mmap=False.
+    dictionaries : dict
+        Column name -> list of values, where a code is an index into the list.
+    watermark : datetime or None
+        Films changed at or after this time are not guaranteed to be included.
+    generation : int
+        Incremented by every write.
+    owner_id : int or None
+        The user whose collection the snapshot holds.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as file:
+            manifest = json.load(file)
+        self.generation = manifest["generation"]
+        self.owner_id = manifest.get("owner_id")
+        self.dictionaries = manifest["dictionaries"]
+        self.watermark = datetime.fromisoformat(manifest["watermark"]) if manifest["watermark"] else None
+        directory = os.path.join(path, _generation_dir(self.generation))
+        self.columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                        for name in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def decode(self, name):
+        """Returns the values of a dictionary-encoded column as an array of strings."""
+        return np.asarray(self.dictionaries[name], dtype=object)[self.columns[name]]
+
+    def to_pandas(self):
+        """
+        Returns a DataFrame with categorical genre, director and status columns built
+        on the snapshot's codes.
+        """
+        import pandas as pd
+
+        data = {}
+        for name in COLUMNS:
+            if name in DICTIONARY_COLUMNS:
+                data[name] = pd.Categorical.from_codes(self.columns[name], self.dictionaries[name])
+            else:
+                data[name] = self.columns[name]
+        return pd.DataFrame(data)
+
+    def statistics(self):
+        """
+        Returns the same dictionary as DatabaseManager.get_statistics, computed from the columns.
+        """
+        genres = self.columns["genre"]
+        statuses = self.dictionaries["status"]
+        if "watched" in statuses:
+            watched = self.columns["status"] == statuses.index("watched")
+        else:
+            watched = np.zeros(len(self), dtype=bool)
+        size = len(self.dictionaries["genre"])
+        counts = np.bincount(genres, minlength=size)
+        watched_counts = np.bincount(genres[watched], minlength=size)
+        rows = [(genre, int(counts[code]), int(watched_counts[code]), int(counts[code] - watched_counts[code]))
+                for code, genre in enumerate(self.dictionaries["genre"]) if counts[code]]
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        total = len(self)
+        watched_total = int(watched.sum())
+        most_watched = min(rows, key=lambda row: (-row[2], row[0])) if watched_total else None
+        return {
+            "total_films": total,
+            "genre_count": {row[0]: row[1] for row in rows},
+            "average_rating": float(self.columns["rating"].astype(np.float64).sum() / total) if total else 0,
+            "watched_count": watched_total,
+            "unwatched_count": total - watched_total,
+            "most_watched_genre": most_watched[0] if most_watched else None
+        }
+
+
+def _generation_dir(generation):
+    return f"gen-{generation:06d}"
+
+
+def open_snapshot(path, mmap=True):
+    return Snapshot(path, mmap)
+
+
+def _encode(values, dictionary):
+    codes = {value: code for code, value in enumerate(dictionary)}
+    encoded = []
+    for value in values:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(dictionary)
+            dictionary.append(value)
+        encoded.append(code)
+    return encoded
+
+
+def rows_to_columns(rows, dictionaries):
+    """
+    Turns (id, genre, director, status, rating, publication_year, updated_at) rows into
+    columns, extending the dictionaries with unseen values, and returns the latest change time.
+    """
+    rows = list(rows)
+    if not rows:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}, None
+    ids, genres, directors, statuses, ratings, years, changed = zip(*rows)
+    columns = {
+        "id": np.asarray(ids, dtype=np.int64),
+        "genre": np.asarray(_encode(genres, dictionaries["genre"]), dtype=np.int32),
+        "director": np.asarray(_encode(directors, dictionaries["director"]), dtype=np.int32),
+        "status": np.asarray(_encode(statuses, dictionaries["status"]), dtype=np.int8),
+        "rating": np.asarray(ratings, dtype=np.float32),
+        "publication_year": np.asarray(years, dtype=np.int16)
+    }
+    stamps = [stamp for stamp in changed if stamp is not None]
+    return columns, max(stamps) if stamps else None
+
+
+def _write(path, columns, dictionaries, watermark, generation, owner_id):
+    directory = os.path.join(path, _generation_dir(generation))
+    os.makedirs(directory, exist_ok=True)
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(columns[name], dtype=dtype))
+    manifest = {
+        "generation": generation,
+        "owner_id": owner_id,
+        "count": int(len(columns["id"])),
+        "watermark": watermark.isoformat() if watermark else None,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "dictionaries": dictionaries
+    }
+    descriptor, temporary = tempfile.mkstemp(dir=path, suffix=".json")
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(temporary, os.path.join(path, MANIFEST))
+    for name in os.listdir(path):
+        if name.startswith("gen-") and name != _generation_dir(generation):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def write_snapshot(db, path, full=False):
+    """
+    Writes or refreshes the snapshot in path from a DatabaseManager.
+
+    Without full, an existing snapshot is refreshed incrementally: rows changed since
+    its watermark replace or extend the stored ones and films no longer in the
+    database are dropped. A snapshot of another user's collection is rebuilt in full.
+
+    Returns
+    -------
+    tuple
+        (films in the snapshot, rows read from the database).
+    """
+    os.makedirs(path, exist_ok=True)
+    generation = _next_generation(path)
+    previous = None if full or generation == 1 else Snapshot(path, mmap=False)
+    if previous is None or previous.owner_id != db.owner_id:
+        dictionaries = {name: [] for name in DICTIONARY_COLUMNS}
+        columns, watermark = rows_to_columns(db.iter_snapshot_rows(), dictionaries)
+        _write(path, columns, dictionaries, watermark, generation, db.owner_id)
+        return len(columns["id"]), len(columns["id"])
+
+    dictionaries = {name: list(values) for name, values in previous.dictionaries.items()}
+    changed, watermark = rows_to_columns(db.iter_snapshot_rows(previous.watermark), dictionaries)
+    keep = np.isin(previous["id"], np.asarray(db.get_film_ids(), dtype=np.int64)) \
+        & ~np.isin(previous["id"], changed["id"])
+    columns = {name: np.concatenate([previous[name][keep], changed[name]]) for name in COLUMNS}
+    order = np.argsort(columns["id"], kind="stable")
+    columns = {name: column[order] for name, column in columns.items()}
+    if watermark is None or (previous.watermark and previous.watermark > watermark):
+        watermark = previous.watermark
+    _write(path, columns, dictionaries, watermark, generation, db.owner_id)
+    return len(columns["id"]), len(changed["id"])
+
+
+def _next_generation(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as file:
+            return json.load(file)["generation"] + 1
+    except (OSError, ValueError, KeyError):
+        return 1
+
+
+def main(argv=None):
+    from database import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="Write a columnar snapshot of the film collection.")
+    parser.add_argument("path", help="snapshot directory")
+    parser.add_argument("--full", action="store_true", help="rebuild instead of refreshing incrementally")
+    parser.add_argument("--owner", type=int, help="user whose collection to snapshot (default: WATCHLIST_OWNER_ID)")
+    args = parser.parse_args(argv)
+    count, read = write_snapshot(DatabaseManager(owner_id=args.owner), args.path, args.full)
+    print(f"Snapshot of {count} films written to {args.path} ({read} rows read).", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""
+Checks that starting the console app stays within the startup-time budget.
+
+Each run imports Main and builds the Main object in a fresh interpreter, so module
+import cost is measured cold. The check fails when the median run exceeds the
+budget, or when startup pulled in a module that should only load on demand.
+
+tests/test_startup.py runs the same check under pytest.
+
+Usage: python startup_check.py [budget_seconds] [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+import config
+
+DEFERRED_MODULES = ("pandas", "matplotlib", "numpy")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import Main
+Main.Main()
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+""" % (DEFERRED_MODULES,)
+
+
+def _run_once():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=directory, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_startup(runs=5):
+    """
+    Starts the console app runs times in fresh interpreters.
+
+    Returns
+    -------
+    tuple
+        (median startup time in seconds, sorted names of the deferred modules any run loaded).
+    """
+    results = [_run_once() for _ in range(runs)]
+    timings = sorted(result["elapsed"] for result in results)
+    loaded = sorted({name for result in results for name in result["loaded"]})
+    return timings[len(timings) // 2], loaded
+
+
+def main(argv):
+    budget = float(argv[1]) if len(argv) > 1 else config.STARTUP_BUDGET
+    runs = int(argv[2]) if len(argv) > 2 else 5
+    median, loaded = measure_startup(runs)
+    print(f"Startup: median {median:.3f}s over {runs} runs (budget {budget:.3f}s)")
+    if median > budget:
+        print("Startup time is over budget.")
+    if loaded:
+        print(f"Modules loaded at startup that should be deferred: {', '.join(loaded)}")
+    return 1 if median > budget or loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
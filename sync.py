@@ -0,0 +1,326 @@
+"""
+Incremental two-way sync between a collection text file and the database.
+
+A sync compares both sides with the state recorded by the previous sync and applies
+only the differences: films added, edited or removed in the file are written to the
+database, and films added, edited or removed in the database are written back to the
+file. Films are matched on their natural key (title, director and year) and compared
+by content hash.
+
+The manifest, collection.txt.sync.json by default, stores the file's modification
+time and size, the database's change signature and the watermark of the last sync;
+a sibling .keys file holds the natural key and content hash of every synced film.
+Only films changed since the watermark, less an overlap of CHANGE_OVERLAP seconds, are
+read from the database. Writers stamp updated_at before they commit, so an edit can
+commit after a sync already saw later stamps without changing the signature; the overlap
+reads it on the next sync, and rows matching the recorded content hash are dropped. When
+neither the file nor the signature changed and no film changed in the overlap, a sync
+ends after one stat call and two indexed queries. The file is only rewritten when
+database changes have to go into it.
+
+A film changed differently on both sides is a conflict, settled in favour of the
+preferred side. A film changed on one side and removed on the other is kept.
+
+Usage:
+    python sync.py collection.txt
+    python sync.py collection.txt --prefer file --owner 7
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+from exporter import EXPORT_COLUMNS, write_text
+from importer import chunked, parse_film_records, validate_chunk
+from models import content_hash, natural_key
+
+PREFERENCES = ("database", "file")
+SYNC_FIELDS = ("title", "director", "genre", "status", "rating", "publication_year", "comments")
+
+
+class SyncReport:
+    """
+    Summary of a sync.
+
+    Attributes
+    ----------
+    to_database : dict
+        Numbers of films 'upserted' into and 'removed' from the database.
+    to_file : dict
+        Numbers of films 'written' to and 'removed' from the file.
+    conflicts : int
+        Number of films changed differently on both sides.
+    rejected : list of tuple
+        (line_number, message) for every invalid record in the file.
+    skipped : bool
+        Whether neither side had changed.
+    error : str or None
+        Why nothing was synced, if so.
+    """
+
+    def __init__(self):
+        self.to_database = {"upserted": 0, "removed": 0}
+        self.to_file = {"written": 0, "removed": 0}
+        self.conflicts = 0
+        self.rejected = []
+        self.skipped = False
+        self.error = None
+
+    def reject(self, line_number, message):
+        self.rejected.append((line_number, message))
+
+    def __str__(self):
+        if self.error:
+            return f"Sync failed: {self.error}"
+        if self.skipped:
+            return "Already in sync"
+        return (f"Database: {self.to_database['upserted']} upserted, {self.to_database['removed']} removed; "
+                f"file: {self.to_file['written']} written, {self.to_file['removed']} removed; "
+                f"{self.conflicts} conflicts")
+
+
+def manifest_paths(file_path, manifest_path=None):
+    """Returns the (manifest, keys file) paths of a collection file."""
+    manifest_path = manifest_path or f"{file_path}.sync.json"
+    return manifest_path, os.path.splitext(manifest_path)[0] + ".keys"
+
+
+def _file_state(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _signature(db):
+    count, changed = db.get_change_signature()
+    return [count, changed.isoformat() if changed else None]
+
+
+def _keyed(film):
+    digest = content_hash(film["title"], film["director"], film["genre"], film["status"], film["rating"],
+                          film["publication_year"], film["comments"])
+    return natural_key(film["title"], film["director"], film["publication_year"]), (film, digest)
+
+
+def _replace(path, write):
+    """Writes a file through write(file) into a temporary file and moves it over path."""
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'w', newline='') as file:
+            write(file)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def load_manifest(manifest_path, owner_id):
+    """Returns the manifest of the previous sync for owner_id, or None."""
+    try:
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("owner_id") == owner_id else None
+
+
+def _load_keys(keys_path):
+    records = {}
+    with open(keys_path) as file:
+        for line in file:
+            key, _, digest = line.rstrip("\n").partition(" ")
+            records[key] = digest
+    return records
+
+
+def _read_file(file_path, report, chunk_size):
+    """
+    Parses and validates the collection file.
+
+    Returns
+    -------
+    dict or None
+        Natural key -> (film, content hash) in file order, where a repeated film keeps its
+        last record, or None when the file has invalid records, which would otherwise be
+        taken for removed films.
+    """
+    films = {}
+    current_year = datetime.now().year
+    with open(file_path, 'r') as file:
+        for chunk in chunked(parse_film_records(file), chunk_size):
+            for film in validate_chunk(chunk, report, current_year):
+                key, value = _keyed(film)
+                films[key] = value
+    if report.rejected:
+        report.error = f"{len(report.rejected)} invalid records in {file_path}; fix them and sync again"
+        return None
+    return films
+
+
+def _changed_films(rows, base):
+    """
+    Picks the films whose content differs from base out of the rows changed since the watermark.
+
+    Returns
+    -------
+    tuple
+        (changed, unseen): natural key -> (film, content hash) for the changed films, and
+        the number of rows read whose key is not in base.
+    """
+    changed = {}
+    unseen = 0
+    for row in rows:
+        film = dict(zip(SYNC_FIELDS, row[2:]))
+        digest = row.content_hash or _keyed(film)[1][1]
+        if row.natural_key not in base:
+            unseen += 1
+        if base.get(row.natural_key) != digest:
+            changed[row.natural_key] = (film, digest)
+    return changed, unseen
+
+
+def sync_file(db, file_path, upsert, remove, manifest_path=None, prefer="database", chunk_size=5000):
+    """
+    Syncs a collection text file and the database in both directions.
+
+    Parameters
+    ----------
+    db : DatabaseManager
+        Read side of the database: change signature, changed rows and natural keys.
+    file_path : str
+        The collection file. It is created when it does not exist and there is no manifest yet.
+    upsert : callable
+        Called with a list of film dicts; must upsert them like DatabaseManager.upsert_films.
+    remove : callable
+        Called with a list of film ids to delete; returns how many were deleted.
+    manifest_path : str, optional
+        Defaults to file_path + '.sync.json'.
+    prefer : str
+        'database' or 'file': the side whose version wins a conflict.
+
+    Returns
+    -------
+    SyncReport
+    """
+    if prefer not in PREFERENCES:
+        raise ValueError(f"Preferred side must be one of {', '.join(PREFERENCES)}")
+    report = SyncReport()
+    manifest_path, keys_path = manifest_paths(file_path, manifest_path)
+    manifest = load_manifest(manifest_path, db.owner_id)
+    file_state = _file_state(file_path)
+    signature = _signature(db)
+    since = datetime.fromisoformat(manifest["watermark"]) if manifest and manifest["watermark"] else None
+    rows = db.iter_sync_rows(since)
+    unchanged = manifest and manifest["file"] == file_state and manifest["signature"] == signature
+    if unchanged:
+        rows = list(rows)
+        if not rows:
+            report.skipped = True
+            return report
+    base = {}
+    if manifest:
+        if file_state is None:
+            report.error = f"File {file_path} not found; remove {manifest_path} to sync from scratch"
+            return report
+        try:
+            base = _load_keys(keys_path)
+        except OSError:
+            manifest = None
+            unchanged = False
+            rows = db.iter_sync_rows()
+
+    database_changed, unseen = _changed_films(rows, base)
+    if unchanged and not database_changed:
+        report.skipped = True
+        return report
+    database_removed = set()
+    if manifest is not None and signature[0] != len(base) + unseen:
+        database_removed = set(base) - set(db.get_natural_keys())
+
+    file_films = None
+    file_changed = {}
+    file_removed = set()
+    if manifest is None or manifest["file"] != file_state:
+        file_films = _read_file(file_path, report, chunk_size) if file_state else {}
+        if file_films is None:
+            return report
+        file_changed = {key: value for key, value in file_films.items() if base.get(key) != value[1]}
+        file_removed = base.keys() - file_films.keys()
+
+    to_database = {}
+    to_file = {}
+    for key, value in file_changed.items():
+        other = database_changed.get(key)
+        if other is None:
+            to_database[key] = value
+        elif other[1] != value[1]:
+            report.conflicts += 1
+            if prefer == "file":
+                to_database[key] = value
+            else:
+                to_file[key] = other
+    for key, value in database_changed.items():
+        if key not in file_changed:
+            to_file[key] = value
+    remove_from_database = file_removed - database_changed.keys()
+    remove_from_file = database_removed - file_changed.keys()
+
+    if to_database:
+        upsert([film for film, _ in to_database.values()])
+        report.to_database["upserted"] = len(to_database)
+    if remove_from_database:
+        ids = db.get_film_ids_by_keys(remove_from_database)
+        if ids:
+            report.to_database["removed"] = remove(list(ids.values()))
+
+    if to_file or remove_from_file:
+        if file_films is None:
+            file_films = _read_file(file_path, report, chunk_size) if file_state else {}
+            if file_films is None:
+                return report
+        report.to_file["removed"] = len(remove_from_file & file_films.keys())
+        merged = {key: to_file.get(key, value) for key, value in file_films.items() if key not in remove_from_file}
+        merged.update(to_file)
+        _replace(file_path, lambda file: write_text(file, (tuple(film[name] for name in EXPORT_COLUMNS)
+                                                            for film, _ in merged.values())))
+        report.to_file["written"] = len(to_file)
+        file_films = merged
+
+    if file_films is not None:
+        _replace(keys_path, lambda file: file.writelines(f"{key} {digest}\n"
+                                                          for key, (_, digest) in file_films.items()))
+    manifest = {
+        "owner_id": db.owner_id,
+        "file": _file_state(file_path),
+        "signature": _signature(db),
+        "watermark": signature[1],
+        "synced": datetime.now().isoformat(timespec="seconds")
+    }
+    _replace(manifest_path, lambda file: json.dump(manifest, file))
+    return report
+
+
+def main(argv=None):
+    from CollectionManager import CollectionManager
+
+    parser = argparse.ArgumentParser(description="Sync a collection text file with the database in both directions.")
+    parser.add_argument("file", help="collection text file")
+    parser.add_argument("--manifest", help="sync manifest (default: FILE.sync.json)")
+    parser.add_argument("--prefer", choices=PREFERENCES, default="database",
+                        help="side whose version wins when a film changed on both")
+    parser.add_argument("--owner", type=int, help="user whose collection to sync (default: WATCHLIST_OWNER_ID)")
+    args = parser.parse_args(argv)
+    manager = CollectionManager(owner_id=args.owner)
+    report = manager.sync_collection_file(args.file, args.manifest, args.prefer)
+    for line_number, message in report.rejected:
+        print(f"  line {line_number}: {message}", file=sys.stderr)
+    print(report, file=sys.stderr)
+    return 1 if report.error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import config
+from startup_check import measure_startup
+
+
+def test_startup_within_budget():
+    median, loaded = measure_startup(runs=3)
+    assert median <= config.STARTUP_BUDGET
+    assert loaded == []
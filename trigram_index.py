@@ -0,0 +1,100 @@
+import os
+import pickle
+import tempfile
+
+
+class TrigramIndex:
+    """
+    An in-memory inverted n-gram index over film titles and directors.
+
+    Substring queries intersect the posting lists of the query's n-grams and only
+    verify the few candidates left, instead of scanning every film.
+
+    Attributes
+    ----------
+    n : int
+        Length of the indexed n-grams.
+    values : dict
+        Film id -> (lowercased title, lowercased director).
+    postings : dict
+        Field name -> n-gram -> set of film ids.
+    signature : tuple, optional
+        Identifies the database state the index was built from.
+    """
+    FIELDS = ("title", "director")
+
+    def __init__(self, n=3):
+        self.n = n
+        self.values = {}
+        self.postings = {field: {} for field in self.FIELDS}
+        self.signature = None
+
+    def grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, film_id, title, director):
+        values = (title.lower(), director.lower())
+        self.values[film_id] = values
+        for field, value in zip(self.FIELDS, values):
+            postings = self.postings[field]
+            for gram in self.grams(value):
+                postings.setdefault(gram, set()).add(film_id)
+
+    def remove(self, film_id):
+        values = self.values.pop(film_id, None)
+        if values is None:
+            return
+        for field, value in zip(self.FIELDS, values):
+            postings = self.postings[field]
+            for gram in self.grams(value):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(film_id)
+                    if not ids:
+                        del postings[gram]
+
+    def update(self, film_id, title, director):
+        self.remove(film_id)
+        self.add(film_id, title, director)
+
+    def search(self, field, query):
+        """
+        Returns the ids of films whose field contains query, ignoring case.
+
+        Queries shorter than n have no n-grams and are checked against every stored value.
+        """
+        position = self.FIELDS.index(field)
+        query = query.lower()
+        grams = self.grams(query)
+        if grams:
+            postings = self.postings[field]
+            lists = sorted((postings.get(gram, ()) for gram in grams), key=len)
+            candidates = set(lists[0])
+            for ids in lists[1:]:
+                if not candidates:
+                    break
+                candidates &= ids
+        else:
+            candidates = self.values.keys()
+        return {film_id for film_id in candidates if query in self.values[film_id][position]}
+
+    def save(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            index = pickle.load(file)
+        if not isinstance(index, cls):
+            raise TypeError(f"{path} does not contain a {cls.__name__}")
+        return index
+
+    @classmethod
+    def build(cls, rows, n=3):
+        index = cls(n)
+        for film_id, title, director in rows:
+            index.add(film_id, title, director)
+        return index
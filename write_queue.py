@@ -0,0 +1,149 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+
+_STOP = object()
+logger = logging.getLogger("watchlist.writes")
+
+
+class GroupCommitQueue:
+    """
+    Applies queued write operations on a background thread, committing them in groups.
+
+    A group is closed after group_size operations or interval seconds, whichever comes
+    first, and committed as one transaction. If any operation of the group fails, the
+    group is rolled back and replayed one operation per transaction, so only the
+    failing operation's future gets the exception.
+
+    Operations are callables taking (session, *args) and returning (result, changes);
+    after_commit(changes) runs once their transaction is committed, before the future
+    returned by submit gets the result. An exception from it is logged; the write
+    stays committed and the future still gets the result.
+
+    Attributes
+    ----------
+    group_size : int
+        Maximum number of operations per transaction.
+    interval : float
+        Seconds the writer waits for more operations before committing a group.
+    commits : int
+        Number of committed transactions.
+    """
+
+    def __init__(self, session_scope, after_commit, group_size=100, interval=0.05):
+        if group_size < 1:
+            raise ValueError("Group size must be a positive integer")
+        self.session_scope = session_scope
+        self.after_commit = after_commit
+        self.group_size = group_size
+        self.interval = interval
+        self.commits = 0
+        self.requests = queue.Queue()
+        self.local = threading.local()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="watchlist-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, operation, *args):
+        """
+        Queues an operation and returns a Future for its result.
+        """
+        if self.closed:
+            raise RuntimeError("The write queue has been shut down")
+        future = Future()
+        pending = getattr(self.local, "pending", None)
+        if pending is None:
+            pending = self.local.pending = deque()
+        while pending and pending[0].done():
+            pending.popleft()
+        pending.append(future)
+        self.requests.put((operation, args, future))
+        return future
+
+    def wait_for_caller(self):
+        """
+        Blocks until every operation submitted by the calling thread is committed or has failed.
+        """
+        pending = getattr(self.local, "pending", None)
+        if pending:
+            wait(list(pending))
+            pending.clear()
+
+    def flush(self):
+        """
+        Blocks until every operation submitted so far, by any thread, is committed or has failed.
+        """
+        if self.closed:
+            return
+        barrier = Future()
+        self.requests.put((None, (), barrier))
+        barrier.result()
+
+    def shutdown(self):
+        """
+        Drains the queue and stops the writer thread.
+        """
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.requests.put(_STOP)
+        self.thread.join()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            request = self.requests.get()
+            if request is _STOP:
+                return
+            group = [request]
+            deadline = time.monotonic() + self.interval
+            while len(group) < self.group_size and group[-1][0] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stop = True
+                    break
+                group.append(request)
+            self._commit(group)
+
+    def _apply(self, group):
+        outcomes = []
+        with self.session_scope() as session:
+            for operation, args, future in group:
+                if operation is not None:
+                    outcomes.append((future, operation(session, *args)))
+                    session.flush()
+                    session.expunge_all()
+        self.commits += 1
+        return outcomes
+
+    def _commit(self, group):
+        try:
+            outcomes = self._apply(group)
+        except Exception:
+            outcomes = []
+            for request in group:
+                if request[0] is None:
+                    continue
+                try:
+                    outcomes.extend(self._apply([request]))
+                except Exception as e:
+                    request[2].set_exception(e)
+        for future, (result, changes) in outcomes:
+            try:
+                self.after_commit(changes)
+            except Exception:
+                logger.exception("Post-commit hook failed after a queued write")
+            future.set_result(result)
+        for operation, _, future in group:
+            if operation is None:
+                future.set_result(None)